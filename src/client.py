@@ -0,0 +1,109 @@
+import argparse
+import json
+from pathlib import Path
+import socket
+import subprocess
+import sys
+from typing import List
+
+from argparse_formatter import Formatter
+
+class Client:
+	"""A connection to a `library.py serve` process.
+	
+	Connects to the server's Unix socket if one is given, otherwise starts a private server over stdin/stdout."""
+	def __init__(self, socket_path:str = None):
+		self._process = None
+		self._socket = None
+		if socket_path:
+			self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			self._socket.connect(socket_path)
+			self._reader = self._socket.makefile('r')
+			self._writer = self._socket.makefile('w')
+		else:
+			library = Path(__file__).with_name('library.py')
+			self._process = subprocess.Popen([sys.executable, str(library), 'serve'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+			self._reader = self._process.stdout
+			self._writer = self._process.stdin
+	
+	def request(self, command:str, **args):
+		"""Send one request and return its result. Raises ValueError if the server could not answer it."""
+		self._writer.write(json.dumps({'command': command, **args}) + '\n')
+		self._writer.flush()
+		line = self._reader.readline()
+		if not line:
+			raise ConnectionError('The server closed the connection')
+		response = json.loads(line)
+		if not response['ok']:
+			raise ValueError(response['error'])
+		return response.get('result')
+	
+	def query(self, expression:str) -> List[str]:
+		return self.request('query', expression=expression)
+	
+	def which(self, blocks:List[str]):
+		return self.request('which', blocks=blocks)
+	
+	def tag(self, blocks:List[str], add:List[str] = [], remove:List[str] = []):
+		return self.request('blocks', blocks=blocks, add=add, remove=remove)
+	
+	def close(self):
+		self._writer.close()
+		self._reader.close()
+		if self._socket:
+			self._socket.close()
+		if self._process:
+			self._process.wait()
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *exc):
+		self.close()
+
+def query(client:Client, expression:List[str]):
+	print(' '.join(client.query(' '.join(expression))))
+
+def which(client:Client, blocks:List[str]):
+	for block, tags in client.which(blocks).items():
+		print(f'{block}: {" ".join(tags) if tags else "(no tags)"}')
+
+def tag_blocks(client:Client, blocks:List[str], add:List[str], remove:List[str]):
+	client.tag(blocks, add, remove)
+
+arg_parser = argparse.ArgumentParser(
+	prog="client",
+	description="Query and edit the library through a running `library serve`",
+	epilog='Nested tags are written as "parent/child" and enum tags are written as "tag:value"',
+	formatter_class=Formatter
+)
+arg_parser.add_argument('-s', '--socket', type=str, help='The socket the server listens on; without one, a private server is started', metavar='PATH')
+
+subparsers = arg_parser.add_subparsers()
+
+query_parser = subparsers.add_parser('query', help='Query the library', formatter_class=Formatter)
+query_parser.add_argument('expression', type=str, nargs='+')
+query_parser.set_defaults(func=query)
+
+which_parser = subparsers.add_parser('which', help='List the tags that contain blocks', formatter_class=Formatter)
+which_parser.add_argument('blocks', type=str, nargs='+', help='The blocks to look up', metavar='BLOCKS')
+which_parser.set_defaults(func=which)
+
+block_parser = subparsers.add_parser('blocks', help='Manipulate blocks', formatter_class=Formatter)
+block_parser.add_argument('blocks', type=str, nargs='*', help='The blocks to manipulate', metavar='BLOCKS')
+action_grp = block_parser.add_argument_group('actions')
+action_grp.add_argument('-a', '--add', type=str, nargs='*', help='Tags to add', required=False, metavar='TAGS', default=[])
+action_grp.add_argument('-r', '--remove', type=str, nargs='*', help='Tags to remove', required=False, metavar='TAGS', default=[])
+block_parser.set_defaults(func=tag_blocks)
+
+if __name__ == "__main__":
+	args = arg_parser.parse_args()
+	func = args.func
+	delattr(args, 'func')
+	with Client(args.socket) as client:
+		delattr(args, 'socket')
+		try:
+			func(client, **args.__dict__)
+		except ValueError as e:
+			print(e)
+			exit(1)
\ No newline at end of file
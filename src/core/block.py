@@ -1,67 +1,100 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Dict, FrozenSet, List, Iterable, Set
+from functools import lru_cache
+from itertools import islice
+from sys import intern
+from typing import Dict, FrozenSet, List, Iterable, Tuple
 
 class BlockState:
-	def __init__(self, state:Dict[str, Set[str]]):
-		self._dict:Dict[str, str] = dict()
-		for key in sorted(state.keys()):
-			self._dict[key] = str(state[key])
+	"""An immutable blockstate, stored as a sorted tuple of interned (key, value) pairs."""
+	__slots__ = ('_items', '_hash')
+	
+	def __init__(self, state:Dict[str, str]):
+		items = tuple(sorted((intern(str(key)), intern(str(value))) for key, value in state.items()))
+		object.__setattr__(self, '_items', items)
+		object.__setattr__(self, '_hash', hash(items))
 	
 	def items(self):
-		return self._dict.items()
+		return self._items
 	def keys(self):
-		return self._dict.keys()
+		return tuple(key for key, _ in self._items)
 	def values(self):
-		return self._dict.values()
+		return tuple(value for _, value in self._items)
+	def get(self, key, default=None):
+		for k, value in self._items:
+			if k == key:
+				return value
+		return default
 	def __iter__(self):
-		return iter(self._dict)
+		return iter(self.keys())
 	def __len__(self):
-		return len(self._dict)
+		return len(self._items)
+	def __contains__(self, key):
+		return self.get(key) is not None
 	def __getitem__(self, key):
-		return self._dict[key]
+		value = self.get(key)
+		if value is None:
+			raise KeyError(key)
+		return value
 	
 	def isParentOf(self, other:BlockState):
-		for key, value in self.items():
-			if key not in other:
-				return False
-			if not other[key] == value:
+		if len(self._items) > len(other._items):
+			return False
+		theirs = other._items
+		for item in self._items:
+			if item not in theirs:
 				return False
 		return True
 	
 	def isChildOf(self, other:BlockState):
 		return other.isParentOf(self)
+	
+	def __eq__(self, other):
+		if self is other:
+			return True
+		if not isinstance(other, BlockState):
+			return False
+		return self._hash == other._hash and self._items == other._items
+	
+	def __hash__(self) -> int:
+		return self._hash
+	
+	def __setattr__(self, name, value):
+		raise AttributeError(f'{type(self).__name__} is immutable')
+	
+	def __reduce__(self):
+		return (BlockState, (dict(self._items),))
+	
+	def __repr__(self):
+		return f'BlockState({dict(self._items)})'
 
-@dataclass(init=True, frozen=True)
 class Block:
-	namespace:str
-	name:str
-	state:BlockState
+	"""An immutable block, optionally narrowed down to a partial blockstate."""
+	__slots__ = ('namespace', 'name', 'state', '_hash')
+	
+	def __init__(self, namespace:str, name:str, state:BlockState):
+		namespace = intern(namespace)
+		name = intern(name)
+		object.__setattr__(self, 'namespace', namespace)
+		object.__setattr__(self, 'name', name)
+		object.__setattr__(self, 'state', state)
+		object.__setattr__(self, '_hash', hash((namespace, name, state)))
 	
 	@classmethod
 	def from_str(cls, block:str):
-		parts = block.split(':')
-		state = dict()
-		while '=' in parts[-1]:
-			key, val = parts.pop().split('=')
-			state[key] = val
-		
-		name = parts.pop()
-		namespace = parts[0] if parts else "minecraft"
-		return Block(namespace, name, BlockState(state))
+		return _parse_block(block)
 	
 	def copy(self):
 		return Block(self.namespace, self.name, self.state)
 	
 	def with_state(self, state:Dict[str, Iterable[str]]):
 		"""Return a copy of this block with additional blockstate.
-		
+	
 		Returns None if the given blockstate conflicts with existing state."""
 		new_state = self._intersect_state(state)
 		if new_state is None:
 			return None
 		return Block(self.namespace, self.name, new_state)
-
+	
 	def isParentOf(self, other:Block):
 		if not isinstance(other, Block):
 			raise ValueError("Cannot compare a Block to a {}".format(type(other)))
@@ -75,6 +108,10 @@ class Block:
 	def intersect(self, other:Block):
 		if self.namespace != other.namespace or self.name != other.name:
 			return None
+		if self.state.isChildOf(other.state):
+			return self
+		if other.state.isChildOf(self.state):
+			return other
 		intersected_state = self._intersect_state(other.state)
 		if intersected_state is None:
 			return None
@@ -84,24 +121,15 @@ class Block:
 		return self.namespace == other.namespace and self.name == other.name
 	
 	def _intersect_state(self, state:Dict[str, str]):
-		fulldict = dict()
-		keys = set(self.state.keys()).union(state.keys())
-		for key in keys:
-			if (key in self.state) and (key in state):
-				if self.state[key] != state[key]:
-					return None
-			fulldict[key] = self.state[key] if key in self.state else state[key]
+		fulldict = dict(self.state.items())
+		for key, value in state.items():
+			existing = fulldict.get(key)
+			if existing is None:
+				fulldict[key] = value
+			elif existing != str(value):
+				return None
 		return BlockState(fulldict)
 	
-	def __eq__(self, other:Block):
-		if not isinstance(other, Block):
-			return False
-		return (
-			self.namespace == other.namespace and
-			self.name == other.name and
-			self.state == other.state
-		)
-
 	def __le__(self, other):
 		return self.isChildOf(other)
 	
@@ -120,31 +148,78 @@ class Block:
 		return ':'.join(parts)
 	
 	def __hash__(self) -> int:
-		return hash(repr(self))
+		return self._hash
 	
 	def __eq__(self, other):
+		if self is other:
+			return True
 		if not isinstance(other, Block):
 			return False
-		return repr(self) == repr(other)
+		return (
+			self._hash == other._hash and
+			self.namespace == other.namespace and
+			self.name == other.name and
+			self.state == other.state
+		)
+	
+	def __setattr__(self, name, value):
+		raise AttributeError(f'{type(self).__name__} is immutable')
+	
+	def __reduce__(self):
+		return (Block, (self.namespace, self.name, self.state))
+
+@lru_cache(maxsize=1 << 16)
+def _parse_block(block:str):
+	# Blocks are immutable, so repeated strings can share one parsed Block.
+	parts = block.split(':')
+	state = dict()
+	while '=' in parts[-1]:
+		key, val = parts.pop().split('=')
+		state[key] = val
+	
+	name = parts.pop()
+	namespace = parts[0] if parts else "minecraft"
+	return Block(namespace, name, BlockState(state))
 
 class BlockCollection(Iterable[Block]):
 	def __init__(self, contents:Iterable[Block] = [], verify = False):
-		self._contents:List[Block] = []
+		# Blocks are stored by slot so replacements keep their position,
+		# and indexed by base so comparisons only visit blocks of the same base.
+		self._contents:Dict[int, Block] = dict()
+		self._index:Dict[Tuple[str, str], List[int]] = dict()
+		self._next_slot = 0
+		# Set when the storage above is shared with a copy; the first mutation copies it.
+		self._shared = False
 		if not contents:
 			return
 		if verify:
-			self.insert(self, contents)
+			self.insert(contents)
 		else:
-			self._contents.extend(contents)
+			for block in contents:
+				self._append(block)
 	@classmethod
-	def from_strings(cls, blocks:Iterable[str]):
-		return BlockCollection([Block.from_str(item) for item in blocks])
-
+	def from_strings(cls, blocks:Iterable[str], verify = False):
+		"""Parse a BlockCollection from block strings.
+		
+		With verify, blocks subsumed by another block are dropped in one sorted pass."""
+		parsed = [Block.from_str(item) for item in blocks]
+		if verify:
+			parsed = _normalized(parsed)
+		return BlockCollection(parsed)
+	
 	def copy(self):
-		return BlockCollection(self._contents)
-
+		"""Return a copy of this BlockCollection, sharing storage until either is modified."""
+		result = BlockCollection()
+		result._contents = self._contents
+		result._index = self._index
+		result._next_slot = self._next_slot
+		result._shared = self._shared = True
+		return result
+	
 	def insert(self, blocks):
 		"""Add the given blocks to this BlockCollection."""
+		if blocks is self:
+			blocks = list(blocks)
 		for obj in blocks:
 			if obj:
 				self._add(obj)
@@ -152,6 +227,8 @@ class BlockCollection(Iterable[Block]):
 	
 	def remove(self, blocks):
 		"""Remove the given blocks from this BlockCollection."""
+		if blocks is self:
+			blocks = list(blocks)
 		for block in blocks:
 			self._discard(block)
 		return self
@@ -166,28 +243,78 @@ class BlockCollection(Iterable[Block]):
 	
 	def intersection(self, blocks):
 		"""Return a new BlockCollection with only the blocks that are in both collections."""
+		if isinstance(blocks, BlockCollection):
+			theirs_by_base = blocks.by_base
+		else:
+			grouped:Dict[Tuple[str, str], List[Block]] = dict()
+			for block in blocks:
+				grouped.setdefault(_base(block), []).append(block)
+			theirs_by_base = lambda base: grouped.get(base, ())
 		result = []
-		for mine in self._contents:
-			for theirs in blocks:
+		seen = set()
+		for mine in self._contents.values():
+			for theirs in theirs_by_base(_base(mine)):
 				intersect = mine & theirs
-				if intersect and intersect not in result:
+				if intersect and intersect not in seen:
+					seen.add(intersect)
 					result.append(intersect)
 		return BlockCollection(result)
 	
+	def exact_difference(self, blocks:Iterable[Block], domains:Dict[Tuple[str, str], StateDomain]):
+		"""Return a new BlockCollection with every state not in the given blocks.
+		
+		Unlike difference, this splits broad blocks into the partial states that remain,
+		using each block's StateDomain."""
+		return BlockSpace.from_collection(self, domains).remove(blocks).to_collection()
+	
+	def by_base(self, base:Tuple[str, str]):
+		"""Return the blocks in this collection with the given (namespace, name)."""
+		return [self._contents[slot] for slot in self._index.get(base, ())]
+	
+	def _own(self):
+		"""Stop sharing storage with copies before modifying it."""
+		if self._shared:
+			self._contents = dict(self._contents)
+			self._index = {base: list(slots) for (base, slots) in self._index.items()}
+			self._shared = False
+	
+	def _append(self, block:Block):
+		self._own()
+		slot = self._next_slot
+		self._next_slot += 1
+		self._contents[slot] = block
+		self._index.setdefault(_base(block), []).append(slot)
+	
 	def _add(self, block:Block):
-		for i, existing in enumerate(self._contents):
+		for slot in self._index.get(_base(block), ()):
+			existing = self._contents[slot]
 			if block >= existing:
-				self._contents[i] = block
+				self._own()
+				self._contents[slot] = block
 				return
 			if block <= existing:
 				return
-		self._contents.append(block)
+		self._append(block)
 	
 	def _discard(self, block:Block):
-		self._contents = [b for b in self._contents if not b.isChildOf(block)]
-
+		base = _base(block)
+		slots = self._index.get(base)
+		if not slots:
+			return
+		removed = {slot for slot in slots if self._contents[slot].isChildOf(block)}
+		if not removed:
+			return
+		self._own()
+		for slot in removed:
+			del self._contents[slot]
+		kept = [slot for slot in slots if slot not in removed]
+		if kept:
+			self._index[base] = kept
+		else:
+			del self._index[base]
+	
 	def __iter__(self):
-		return iter(self._contents)
+		return iter(self._contents.values())
 	
 	def __add__(self, other:Iterable[Block]):
 		return self.union(other)
@@ -202,15 +329,316 @@ class BlockCollection(Iterable[Block]):
 		return len(self._contents)
 	
 	def __repr__(self):
-		return ' '.join([str(block) for block in self._contents])
+		return ' '.join([str(block) for block in self._contents.values()])
 	
 	def __str__(self):
-		return f'{" ".join([str(block) for block in self._contents[:4]])}{"..." if len(self._contents) > 4 else ""} ({len(self._contents)} items)'
+		first = [str(block) for block in islice(self._contents.values(), 4)]
+		return f'{" ".join(first)}{"..." if len(self._contents) > 4 else ""} ({len(self._contents)} items)'
 	
 	def __eq__(self, other):
 		if not isinstance(other, BlockCollection):
 			return False
-		return frozenset(self._contents) == frozenset(other._contents)
+		return frozenset(self._contents.values()) == frozenset(other._contents.values())
+	
+	def __bool__(self):
+		return bool(self._contents)
+
+def _base(block:Block):
+	return (block.namespace, block.name)
+
+def _normalized(blocks:List[Block]):
+	"""Drop every block that is a child (or duplicate) of another, keeping the original order."""
+	# Parents have fewer blockstate keys than their children, so visit them first.
+	kept:Dict[Tuple[str, str], List[Block]] = dict()
+	dropped = set()
+	for i in sorted(range(len(blocks)), key=lambda i: len(blocks[i].state)):
+		block = blocks[i]
+		parents = kept.setdefault(_base(block), [])
+		if any(block <= parent for parent in parents):
+			dropped.add(i)
+		else:
+			parents.append(block)
+	return [block for (i, block) in enumerate(blocks) if i not in dropped]
+
+class StateDomain:
+	"""Every value each blockstate property of a block can take.
+	
+	The full states of the block are numbered as a mixed-radix number over the
+	properties, so a set of states can be stored as a single integer bitmask."""
+	def __init__(self, properties:Dict[str, Iterable[str]]):
+		self.keys:Tuple[str, ...] = tuple(sorted(intern(str(key)) for key in properties))
+		self.values:Dict[str, Tuple[str, ...]] = {key: tuple(intern(str(value)) for value in properties[key]) for key in self.keys}
+		self._strides:Dict[str, int] = dict()
+		self.size = 1
+		for key in reversed(self.keys):
+			self._strides[key] = self.size
+			self.size *= len(self.values[key])
+		self.full = (1 << self.size) - 1
+		self._value_masks:Dict[Tuple[str, str], int] = dict()
+		self._cubes:List[Tuple[BlockState, int]] = None
+	
+	def mask(self, state:BlockState):
+		"""Return the bitmask of every full state matching the given (partial) state."""
+		result = self.full
+		for key, value in state.items():
+			result &= self._value_mask(key, value)
+		return result
+	
+	def state(self, index:int):
+		"""Return the full state numbered by the given bit index."""
+		return BlockState({key: self.values[key][(index // self._strides[key]) % len(self.values[key])] for key in self.keys})
+	
+	def states(self, mask:int):
+		"""Iterate over the full states in the given bitmask."""
+		index = 0
+		while mask:
+			if mask & 1:
+				yield self.state(index)
+			mask >>= 1
+			index += 1
+	
+	def cover(self, mask:int):
+		"""Return a small list of partial states that exactly cover the given bitmask.
+		
+		Greedily picks the partial state covering the most remaining states,
+		then drops any partial state the others already cover."""
+		candidates = [(state, cube) for (state, cube) in self._all_cubes() if not cube & ~mask]
+		chosen:List[Tuple[BlockState, int]] = []
+		remaining = mask
+		while remaining:
+			best = max(candidates, key=lambda candidate: (_popcount(candidate[1] & remaining), _popcount(candidate[1])))
+			chosen.append(best)
+			remaining &= ~best[1]
+		for i in reversed(range(len(chosen))):
+			others = 0
+			for j, (_, cube) in enumerate(chosen):
+				if j != i:
+					others |= cube
+			if not chosen[i][1] & ~others:
+				del chosen[i]
+		return [state for (state, _) in chosen]
+	
+	def _all_cubes(self):
+		"""Every partial state over this domain, with its bitmask, broadest first."""
+		if self._cubes is None:
+			partials:List[Dict[str, str]] = [dict()]
+			for key in self.keys:
+				partials = [dict(partial, **{key: value}) for partial in partials for value in self.values[key]] + partials
+			self._cubes = sorted(
+				[(BlockState(partial), self.mask(BlockState(partial))) for partial in partials],
+				key=lambda cube: len(cube[0])
+			)
+		return self._cubes
+	
+	def _value_mask(self, key:str, value:str):
+		cached = self._value_masks.get((key, value))
+		if cached is not None:
+			return cached
+		if key not in self.values:
+			raise ValueError(f'Unknown blockstate property "{key}"')
+		if value not in self.values[key]:
+			raise ValueError(f'Unknown value "{value}" for blockstate property "{key}"')
+		stride = self._strides[key]
+		count = len(self.values[key])
+		position = self.values[key].index(value)
+		result = 0
+		for index in range(self.size):
+			if (index // stride) % count == position:
+				result |= 1 << index
+		self._value_masks[(key, value)] = result
+		return result
+	
+	def __repr__(self):
+		return f'StateDomain({self.values})'
+
+class BlockSpace:
+	"""A set of blockstates, stored as one bitmask per block over its StateDomain.
+	
+	Mirrors the BlockCollection API, but unions, differences, intersections and
+	xors are exact and operate on whole state spaces with bitwise operations.
+	Blocks without a registered domain are kept as a BlockCollection instead of a mask,
+	and combine the way BlockCollections do."""
+	def __init__(self, domains:Dict[Tuple[str, str], StateDomain], masks:Dict[Tuple[str, str], int|BlockCollection] = None):
+		self._domains = domains
+		self._masks:Dict[Tuple[str, str], int|BlockCollection] = {base: mask for (base, mask) in (masks or dict()).items() if mask}
+	
+	@classmethod
+	def from_collection(cls, blocks:Iterable[Block], domains:Dict[Tuple[str, str], StateDomain]):
+		"""Encode the given blocks, which must only use properties from their block's domain, if it has one."""
+		result = BlockSpace(domains)
+		for block in blocks:
+			base = _base(block)
+			domain = domains.get(base)
+			if domain is None:
+				result._masks.setdefault(base, BlockCollection()).insert([block])
+			else:
+				result._masks[base] = result._masks.get(base, 0) | domain.mask(block.state)
+		return result
+	
+	@classmethod
+	def partition(cls, spaces:Dict[str, BlockSpace], domains:Dict[Tuple[str, str], StateDomain]):
+		"""Split the states of the given spaces into disjoint spaces, keyed by which of the given spaces contain them.
+		
+		Each block's states are refined once per space, so this is linear in the number of spaces.
+		Blocks without a domain are refined with BlockCollection operations instead."""
+		# base -> [(states, keys of the spaces containing them)]
+		parts:Dict[Tuple[str, str], List[Tuple[int|BlockCollection, FrozenSet[str]]]] = dict()
+		for key, space in spaces.items():
+			for base, mask in space._masks.items():
+				if isinstance(mask, BlockCollection):
+					parts[base] = _refine_blocks(parts.get(base, []), mask, key)
+					continue
+				refined = []
+				for states, keys in parts.get(base, [(space.domain(base).full, frozenset())]):
+					if states & mask:
+						refined.append((states & mask, keys | {key}))
+					if states & ~mask:
+						refined.append((states & ~mask, keys))
+				parts[base] = refined
+		result:Dict[FrozenSet[str], BlockSpace] = dict()
+		for base, refined in parts.items():
+			for states, keys in refined:
+				if keys:
+					result.setdefault(keys, BlockSpace(domains))._masks[base] = states
+		return result
+	
+	def domain(self, base:Tuple[str, str]):
+		return self._domains.get(base)
+	
+	def bases(self):
+		"""The (namespace, name) of every block with states in this BlockSpace."""
+		return list(self._masks.keys())
+	
+	def restricted(self, bases:Iterable[Tuple[str, str]]):
+		"""Return a new BlockSpace with only the states of the given blocks."""
+		return BlockSpace(self._domains, {base: self._masks[base] for base in bases if base in self._masks})
+	
+	def to_collection(self):
+		"""Decode this BlockSpace into a BlockCollection."""
+		result = []
+		for (namespace, name), mask in self._masks.items():
+			if isinstance(mask, BlockCollection):
+				result.extend(mask)
+			else:
+				result.extend(Block(namespace, name, state) for state in self.domain((namespace, name)).cover(mask))
+		return BlockCollection(result)
+	
+	def copy(self):
+		return BlockSpace(self._domains, self._masks)
+	
+	def insert(self, blocks):
+		"""Add the given blocks to this BlockSpace."""
+		for base, mask in self._coerce(blocks)._masks.items():
+			if isinstance(mask, BlockCollection):
+				self._masks[base] = self._masks[base].union(mask) if base in self._masks else mask
+			else:
+				self._masks[base] = self._masks.get(base, 0) | mask
+		return self
+	
+	def remove(self, blocks):
+		"""Remove the given blocks from this BlockSpace."""
+		for base, mask in self._coerce(blocks)._masks.items():
+			if base not in self._masks:
+				continue
+			if isinstance(mask, BlockCollection):
+				remaining = self._masks[base].difference(mask)
+			else:
+				remaining = self._masks[base] & ~mask
+			if remaining:
+				self._masks[base] = remaining
+			else:
+				del self._masks[base]
+		return self
+	
+	def union(self, blocks):
+		"""Return a copy of this BlockSpace but with the given blocks."""
+		return self.copy().insert(blocks)
+	
+	def difference(self, blocks):
+		"""Return a copy of this BlockSpace but without the given blocks."""
+		return self.copy().remove(blocks)
+	
+	def intersection(self, blocks):
+		"""Return a new BlockSpace with only the states that are in both."""
+		theirs = self._coerce(blocks)._masks
+		masks = dict()
+		for base, mask in self._masks.items():
+			if base in theirs:
+				masks[base] = mask.intersection(theirs[base]) if isinstance(mask, BlockCollection) else mask & theirs[base]
+		return BlockSpace(self._domains, masks)
+	
+	def symmetric_difference(self, blocks):
+		"""Return a new BlockSpace with the states that are in exactly one of the two."""
+		masks = dict(self._masks)
+		for base, mask in self._coerce(blocks)._masks.items():
+			if base not in masks:
+				masks[base] = mask
+			elif isinstance(mask, BlockCollection):
+				masks[base] = masks[base].union(mask) - masks[base].intersection(mask)
+			else:
+				masks[base] = masks[base] ^ mask
+		return BlockSpace(self._domains, masks)
+	
+	def _coerce(self, blocks):
+		if isinstance(blocks, BlockSpace):
+			return blocks
+		return BlockSpace.from_collection(blocks, self._domains)
+	
+	def __iter__(self):
+		return iter(self.to_collection())
+	
+	def __add__(self, other):
+		return self.union(other)
+	
+	def __or__(self, other):
+		return self.union(other)
+	
+	def __sub__(self, other):
+		return self.difference(other)
+	
+	def __mul__(self, other):
+		return self.intersection(other)
+	
+	def __and__(self, other):
+		return self.intersection(other)
+	
+	def __xor__(self, other):
+		return self.symmetric_difference(other)
+	
+	def __len__(self):
+		"""The number of full blockstates in this BlockSpace."""
+		return sum(len(mask) if isinstance(mask, BlockCollection) else _popcount(mask) for mask in self._masks.values())
+	
+	def __repr__(self):
+		return repr(self.to_collection())
+	
+	def __str__(self):
+		return str(self.to_collection())
+	
+	def __eq__(self, other):
+		if not isinstance(other, BlockSpace):
+			return False
+		return self._masks == other._masks
 	
 	def __bool__(self):
-		return bool(self._contents)
\ No newline at end of file
+		return bool(self._masks)
+
+
+def _popcount(mask:int):
+	return bin(mask).count('1')
+
+def _refine_blocks(parts:List[Tuple[BlockCollection, FrozenSet[str]]], blocks:BlockCollection, key:str):
+	"""Split each part into the blocks inside and outside of the given blocks, the way BlockCollections would."""
+	refined = []
+	rest = blocks
+	for part, keys in parts:
+		inside = part.intersection(blocks)
+		outside = part.difference(blocks)
+		if inside:
+			refined.append((inside, keys | {key}))
+		if outside:
+			refined.append((outside, keys))
+		rest = rest.difference(part)
+	if rest:
+		refined.append((rest, frozenset([key])))
+	return refined
\ No newline at end of file
@@ -1,11 +1,19 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import csv
+import os
 from dataclasses import dataclass, field
 from pathlib import Path
+import pickle
 import shutil
-from typing import Dict, Iterable
+import threading
+from typing import Callable, Dict, Iterable, List, Set, Tuple
 
-from core.block import Block, BlockCollection
+from core.block import Block, BlockCollection, StateDomain
+
+SNAPSHOT_FILE = '.snapshot.pickle'
+_SNAPSHOT_VERSION = 2
 
 @dataclass(init=True, repr=True)
 class _Node:
@@ -16,18 +24,38 @@ class TagLibrary:
 	def __init__(self, folder:Path = None):
 		self.folder = Path(folder) if folder else None
 		self._root = _Node()
+		self._domains:Dict[str, StateDomain] = dict()
+		# Compiled tag files, keyed by path relative to the folder: (mtime, size, blocks)
+		self._snapshot:Dict[str, Tuple[int, int, BlockCollection]] = None
+		self._snapshot_dirty = False
+		# Enum tag values: tag -> (values, folder mtime when they last matched the disk, or None if edited since)
+		self._manifest:Dict[str, Tuple[Set[str], int]] = dict()
+		self._saved_manifest:Dict[str, Tuple[int, Tuple[str, ...]]] = dict()
+		# Memoized tag results: (tag, value) -> (blocks, the version of every tag they were derived from)
+		self._versions:Dict[str, int] = dict()
+		self._memo:Dict[Tuple[str, str], Tuple[BlockCollection, Dict[str, int]]] = dict()
+		# Per-thread tracking() and counting() stacks, so concurrent reads are attributed to the right block
+		self._local = threading.local()
+		# Reverse index: block base -> (tag, value) -> the blocks of that tag with that base
+		self._reverse:Dict[Tuple[str, str], Dict[Tuple[str, str], List[Block]]] = None
+		# Derived tags in the reverse index: tag -> (versions of its sources, bases it was indexed under)
+		self._derived:Dict[str, Tuple[Dict[str, int], Set[Tuple[str, str]]]] = dict()
+		# Tags saved during an open session, written once when it closes
+		self._pending:Dict[str, Tag] = None
+		self._lock = threading.RLock()
 	
 	def get(self, tag:str):
-		node = self._get_node(tag, create=bool(self.folder))
-		if node.tag:
-			return node.tag
-		folder = self._get_folder(tag)
-		if not folder or not folder.exists():
-			raise ValueError(f'No such tag: {tag}')
-		if folder.joinpath('_bool.tsv').exists():
-			return self.create_bool(tag)
-		else:
-			return self.create_enum(tag, [])
+		with self._lock:
+			node = self._get_node(tag, create=bool(self.folder))
+			if node.tag:
+				return node.tag
+			folder = self._get_folder(tag)
+			if not folder or not folder.exists():
+				raise ValueError(f'No such tag: {tag}')
+			if folder.joinpath('_bool.tsv').exists():
+				return self.create_bool(tag)
+			else:
+				return self.create_enum(tag, [])
 	
 	def delete(self, tag:str):
 		node = self._get_node(tag, create=bool(self.folder))
@@ -35,15 +63,21 @@ class TagLibrary:
 			tag_ = self.get(tag)
 			tag_.delete()
 		node.tag = None
+		self._changed(tag)
+		self._unindex()
 	
 	def create_bool(self, tag:str):
 		node = self._get_node(tag, create=True)
 		node.tag = BoolTag(tag, self)
+		self._changed(tag)
+		self._unindex()
 		return node.tag
 	
 	def create_enum(self, tag:str, values:Iterable[str]):
 		node = self._get_node(tag, create=True)
 		node.tag = EnumTag(tag, self, values=values)
+		self._changed(tag)
+		self._unindex()
 		return node.tag
 	
 	def register_mixin(self, mixin:Tag):
@@ -52,6 +86,337 @@ class TagLibrary:
 			print(f'Overriding existing tag {str(mixin)} with mixin!')
 		node.tag = mixin
 		mixin._library = self
+		self._changed(str(mixin))
+		self._unindex()
+	
+	@contextmanager
+	def session(self):
+		"""Collect the tags saved inside this block and write each of them once when it exits.
+		
+		Nothing is written if the block raises."""
+		if self._pending is not None:
+			yield self
+			return
+		self._pending = dict()
+		try:
+			yield self
+			pending = self._pending
+		finally:
+			self._pending = None
+		for tag in pending.values():
+			tag._write()
+	
+	def _queue_save(self, tag:Tag):
+		"""Queue the tag to be written when the session closes. Returns False if there is no session."""
+		if self._pending is None:
+			return False
+		self._pending[str(tag)] = tag
+		return True
+	
+	def preload(self, workers:int = None):
+		"""Eagerly load every tag in the library folder, reading the files in a thread pool."""
+		if not self.folder:
+			return
+		jobs:List[Tuple[Tag, str, Path]] = []
+		for dirpath, _, filenames in os.walk(self.folder):
+			tag = Path(dirpath).relative_to(self.folder).as_posix()
+			if tag == '.':
+				continue
+			node = self._get_node(tag, create=True)
+			if node.tag is None:
+				if BoolTag._KEY + '.tsv' in filenames:
+					node.tag = BoolTag(tag, self)
+				else:
+					node.tag = EnumTag(tag, self, [])
+			tag_ = node.tag
+			if isinstance(tag_, EnumTag) and tag not in self._manifest:
+				values = {os.path.splitext(filename)[0] for filename in filenames if filename.endswith('.tsv')}
+				self._manifest[tag] = (values, Path(dirpath).stat().st_mtime_ns)
+				self._snapshot_dirty = True
+			for filename in filenames:
+				key, suffix = os.path.splitext(filename)
+				if suffix != '.tsv':
+					continue
+				if isinstance(tag_, BoolTag) and key == BoolTag._KEY and tag_._contents is None:
+					jobs.append((tag_, key, Path(dirpath, filename)))
+				elif isinstance(tag_, EnumTag) and tag_._contents.get(key) is None:
+					jobs.append((tag_, key, Path(dirpath, filename)))
+		self._get_snapshot()
+		with ThreadPoolExecutor(max_workers=workers) as executor:
+			loaded = executor.map(self._read_file, [file for (_, _, file) in jobs])
+			for (tag_, key, _), blocks in zip(jobs, loaded):
+				if isinstance(tag_, BoolTag):
+					tag_._contents = blocks
+				else:
+					tag_._contents[key] = blocks
+	
+	def tags_of(self, block:Block):
+		"""List every tag, written "tag" or "tag:value", with a block that covers the given block."""
+		if self._reverse is None:
+			self._build_reverse()
+		for tag, (sources, _) in list(self._derived.items()):
+			if not self.is_current(sources):
+				self._index_derived(self.get(tag))
+		entries = self._reverse.get((block.namespace, block.name), dict())
+		return sorted(
+			f'{tag}:{value}' if value is not None else tag
+			for ((tag, value), blocks) in entries.items()
+			if any(block <= theirs for theirs in blocks)
+		)
+	
+	def _tags(self):
+		"""Iterate over every tag in memory."""
+		stack = [self._root]
+		while stack:
+			node = stack.pop()
+			if node.tag:
+				yield node.tag
+			stack.extend(node.children.values())
+	
+	def _build_reverse(self):
+		self.preload()
+		self._reverse = dict()
+		self._derived = dict()
+		for tag_ in list(self._tags()):
+			if isinstance(tag_, BoolTag):
+				self._index(str(tag_), None, tag_.get())
+			elif isinstance(tag_, EnumTag):
+				for value in list(tag_.values()):
+					self._index(str(tag_), value, tag_.get(value))
+			else:
+				self._index_derived(tag_)
+	
+	def _index(self, tag:str, value:str, blocks:BlockCollection, bases:Iterable[Tuple[str, str]] = None):
+		"""Index the given bases (or every base) of a tag's blocks."""
+		if bases is None:
+			bases = {(block.namespace, block.name) for block in blocks}
+		for base in bases:
+			entries = self._reverse.setdefault(base, dict())
+			mine = blocks.by_base(base)
+			if mine:
+				entries[(tag, value)] = mine
+			else:
+				entries.pop((tag, value), None)
+	
+	def _index_derived(self, tag_:Tag):
+		"""(Re)index a derived tag, such as a mixin, remembering what it was derived from."""
+		tag = str(tag_)
+		_, old_bases = self._derived.get(tag, (None, set()))
+		blocks = tag_.get()
+		bases = {(block.namespace, block.name) for block in blocks}
+		self._index(tag, None, blocks, old_bases | bases)
+		self._derived[tag] = (dict(self._memo.get((tag, None), (None, dict()))[1]), bases)
+	
+	def _reindex(self, tag:str, value:str, contents:BlockCollection, changed:Iterable[Block]):
+		"""Update the reverse index after the given blocks were added to or removed from a tag."""
+		if self._reverse is not None:
+			self._index(tag, value, contents, {(block.namespace, block.name) for block in changed})
+	
+	def _unindex(self):
+		self._reverse = None
+	
+	def register_domain(self, tag:str, domain:StateDomain):
+		"""Declare the blockstate properties shared by every block in the given tag."""
+		self._domains[tag] = domain
+	
+	def domains(self):
+		"""Map the base of every block in a tag with a registered domain to that domain."""
+		result:Dict[Tuple[str, str], StateDomain] = dict()
+		for tag, domain in self._domains.items():
+			for block in self.get(tag).get():
+				result[(block.namespace, block.name)] = domain
+		return result
+	
+	def _changed(self, tag:str):
+		"""Invalidate every memoized result derived from the given tag."""
+		self._versions[tag] = self._versions.get(tag, 0) + 1
+	
+	@contextmanager
+	def tracking(self):
+		"""Collect the version of every tag read inside this block into the yielded dict."""
+		sources:Dict[str, int] = dict()
+		self._dependencies.append(sources)
+		try:
+			yield sources
+		finally:
+			self._dependencies.pop()
+	
+	def depend_on(self, sources:Dict[str, int]):
+		"""Record tag versions collected elsewhere (e.g. on another thread) into the open tracking() blocks."""
+		for outer in self._dependencies:
+			outer.update(sources)
+	
+	@contextmanager
+	def counting(self):
+		"""Count where the tags read inside this block came from into the yielded dict:
+		'memo' for memoized results, 'snapshot' and 'disk' for tag files."""
+		counts = {'memo': 0, 'snapshot': 0, 'disk': 0}
+		self._counters.append(counts)
+		try:
+			yield counts
+		finally:
+			self._counters.pop()
+	
+	def _count(self, source:str):
+		for counts in self._counters:
+			counts[source] += 1
+	
+	@property
+	def _dependencies(self) -> List[Dict[str, int]]:
+		return self._thread_stack('dependencies')
+	
+	@property
+	def _counters(self) -> List[Dict[str, int]]:
+		return self._thread_stack('counters')
+	
+	def _thread_stack(self, name:str):
+		stack = getattr(self._local, name, None)
+		if stack is None:
+			stack = []
+			setattr(self._local, name, stack)
+		return stack
+	
+	def is_current(self, sources:Dict[str, int]):
+		"""Return whether none of the tags collected by tracking() have changed since."""
+		return all(self._versions.get(tag, 0) == version for (tag, version) in sources.items())
+	
+	def refresh(self):
+		"""Forget the tags whose files changed on disk since they were read.
+		
+		Returns the names of the affected tags. Unsaved edits to them are lost."""
+		if not self.folder:
+			return set()
+		changed = set()
+		snapshot = self._get_snapshot()
+		for key, (mtime, size, _) in list(snapshot.items()):
+			file = self.folder.joinpath(key)
+			if not file.exists() or (file.stat().st_mtime_ns, file.stat().st_size) != (mtime, size):
+				del snapshot[key]
+				self._snapshot_dirty = True
+				changed.add(Path(key).parent.as_posix())
+		for tag, (_, mtime) in list(self._manifest.items()):
+			folder = self._get_folder(tag)
+			if mtime is not None and (not folder.exists() or folder.stat().st_mtime_ns != mtime):
+				del self._manifest[tag]
+				changed.add(tag)
+		for tag in changed:
+			try:
+				tag_ = self._get_node(tag).tag
+			except ValueError:
+				continue
+			if isinstance(tag_, BoolTag):
+				tag_._contents = None
+			elif isinstance(tag_, EnumTag):
+				tag_._contents = dict()
+				tag_._edited.clear()
+			self._changed(tag)
+		if changed:
+			self._unindex()
+		return changed
+	
+	def _memoize(self, tag:str, value:str, compute:Callable[[], BlockCollection]):
+		"""Return the memoized result of a tag, recomputing it if any tag it was derived from changed."""
+		entry = self._memo.get((tag, value))
+		if entry is None or not self.is_current(entry[1]):
+			sources = {tag: self._versions.get(tag, 0)}
+			self._dependencies.append(sources)
+			try:
+				result = compute()
+			finally:
+				self._dependencies.pop()
+			entry = (result, sources)
+			self._memo[(tag, value)] = entry
+		else:
+			self._count('memo')
+		self.depend_on(entry[1])
+		return entry[0].copy()
+	
+	def save_snapshot(self):
+		"""Write the compiled snapshot of the tag files read so far, if it changed."""
+		if not self.folder or not self._snapshot_dirty:
+			return
+		snapshot = self._get_snapshot()
+		for key in [key for key in snapshot if not self.folder.joinpath(key).exists()]:
+			del snapshot[key]
+		manifest = dict(self._saved_manifest)
+		for tag, (values, mtime) in self._manifest.items():
+			if mtime is not None:
+				manifest[tag] = (mtime, tuple(sorted(values)))
+			else:
+				manifest.pop(tag, None)
+		path = self.folder.joinpath(SNAPSHOT_FILE)
+		temp = path.with_name(path.name + '.tmp')
+		with temp.open('wb') as stream:
+			pickle.dump((_SNAPSHOT_VERSION, snapshot, manifest), stream, protocol=pickle.HIGHEST_PROTOCOL)
+		temp.replace(path)
+		self._snapshot_dirty = False
+	
+	def _get_snapshot(self):
+		if self._snapshot is None:
+			self._snapshot = dict()
+			path = self.folder.joinpath(SNAPSHOT_FILE)
+			if path.exists():
+				try:
+					with path.open('rb') as stream:
+						version, *contents = pickle.load(stream)
+					if version == _SNAPSHOT_VERSION:
+						self._snapshot, self._saved_manifest = contents
+				except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+					pass # Stale or corrupt snapshots are rebuilt from the tag files
+		return self._snapshot
+	
+	def _enum_values(self, tag:str):
+		"""The values of an enum tag, only listing its folder the first time they are needed."""
+		if tag not in self._manifest:
+			folder = self._get_folder(tag)
+			if not folder or not folder.exists():
+				self._manifest[tag] = (set(), None)
+			else:
+				mtime = folder.stat().st_mtime_ns
+				self._get_snapshot()
+				saved = self._saved_manifest.get(tag)
+				if saved and saved[0] == mtime:
+					values = set(saved[1])
+				else:
+					values = {path.stem for path in folder.iterdir() if path.suffix == '.tsv'}
+					self._snapshot_dirty = True
+				self._manifest[tag] = (values, mtime)
+		return self._manifest[tag][0]
+	
+	def _edit_values(self, tag:str, add:Iterable[str] = (), remove:Iterable[str] = ()):
+		values = self._enum_values(tag)
+		values.update(add)
+		values.difference_update(remove)
+		self._manifest[tag] = (values, None)
+	
+	def _sync_values(self, tag:str, values:Iterable[str]):
+		"""Record that the given values now match the enum tag's folder."""
+		folder = self._get_folder(tag)
+		self._manifest[tag] = (set(values), folder.stat().st_mtime_ns if folder.exists() else None)
+		self._snapshot_dirty = True
+	
+	def _read_file(self, file:Path):
+		"""Read a tag file, reusing its compiled form if the file has not changed since."""
+		stat = file.stat()
+		key = file.relative_to(self.folder).as_posix()
+		snapshot = self._get_snapshot()
+		entry = snapshot.get(key)
+		if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+			self._count('snapshot')
+			return entry[2].copy()
+		self._count('disk')
+		with file.open('r') as stream:
+			blocks = [block for line in csv.reader(stream, delimiter='\t') for block in line]
+		collection = BlockCollection.from_strings(blocks, verify=True)
+		snapshot[key] = (stat.st_mtime_ns, stat.st_size, collection)
+		self._snapshot_dirty = True
+		return collection.copy()
+	
+	def _remember_file(self, file:Path, blocks:BlockCollection):
+		"""Record the blocks just written to a tag file, so refresh() notices when something else changes it."""
+		stat = file.stat()
+		self._get_snapshot()[file.relative_to(self.folder).as_posix()] = (stat.st_mtime_ns, stat.st_size, blocks.copy())
+		self._snapshot_dirty = True
 	
 	def _get_node(self, tag:str, create=False):
 		here = self._root
@@ -84,6 +449,15 @@ class Tag:
 			raise RuntimeError('Tried to call get on a generic Tag.')
 		raise NotImplementedError(f'Subclass {type(self)} is missing a get method!')
 	
+	def _memoized(self, value:str, compute:Callable[[], BlockCollection]):
+		if self._library is None:
+			return compute()
+		return self._library._memoize(self._tag, value, compute)
+	
+	def _changed(self):
+		if self._library is not None:
+			self._library._changed(self._tag)
+	
 	def add(self, _:BlockCollection):
 		raise RuntimeError('Tried to call add on a generic Tag')
 	
@@ -97,21 +471,21 @@ class Tag:
 	
 	def _load_file(self, key:str):
 		file = self._file(key)
-		if file is None:
+		if file is None or not file.exists():
 			return None
-		output = BlockCollection()
-		with file.open('r') as stream:
-			for line in csv.reader(stream, delimiter='\t'):
-				output.insert(BlockCollection.from_strings(line))
-		return output
+		return self._library._read_file(file)
 
 	def _save_file(self, key:str, blocks:BlockCollection):
 		file:Path = self._file(key)
 		if file is None:
 			raise RuntimeError('Cannot save state to disk in a memory-only library!')
 		file.parent.mkdir(exist_ok=True)
-		with file.open('w') as stream:
+		# Write through a temporary file so an interrupted save never leaves a partial file
+		temp = file.with_name(file.name + '.tmp')
+		with temp.open('w') as stream:
 			stream.write('\n'.join([repr(block) for block in blocks]))
+		temp.replace(file)
+		self._library._remember_file(file, blocks)
 	
 	def _delete(self):
 		folder = self._library._get_folder(self)
@@ -126,6 +500,9 @@ class BoolTag(Tag):
 		self._contents:BlockCollection = None
 	
 	def get(self):
+		return self._memoized(None, self._get)
+	
+	def _get(self):
 		self._load()
 		return self._contents.copy()
 	
@@ -134,10 +511,14 @@ class BoolTag(Tag):
 			self.parent().add(blocks)
 		self._load()
 		self._contents.insert(blocks)
+		self._changed()
+		self._library._reindex(self._tag, None, self._contents, blocks)
 	
 	def remove(self, blocks:Iterable[Block]):
 		self._load()
 		self._contents.remove(blocks)
+		self._changed()
+		self._library._reindex(self._tag, None, self._contents, blocks)
 	
 	def _load(self):
 		if self._contents is None:
@@ -146,6 +527,10 @@ class BoolTag(Tag):
 	def save(self):
 		if self.parent():
 			self.parent().save()
+		if not self._library._queue_save(self):
+			self._write()
+	
+	def _write(self):
 		print(f'Saving {self}')
 		self._save_file(self._KEY, self._contents or BlockCollection())
 	
@@ -163,10 +548,16 @@ class EnumTag(Tag):
 	
 	def get(self, value:str=...):
 		if value is ...:
-			result = BlockCollection()
-			for val in self.values():
-				result.insert(self.get(val))
-			return result
+			return self._memoized(None, self._get_all)
+		return self._memoized(value, lambda: self._get(value))
+	
+	def _get_all(self):
+		result = BlockCollection()
+		for val in self.values():
+			result.insert(self.get(val))
+		return result
+	
+	def _get(self, value:str):
 		if not self._load(value):
 			raise ValueError(f'The tag {self} has no value "{value}"')
 		
@@ -202,20 +593,22 @@ class EnumTag(Tag):
 		
 		self._contents[value].insert(blocks)
 		self._edited.add(value)
+		self._changed()
+		self._library._reindex(self._tag, value, self._contents[value], blocks)
 	
 	def remove(self, value:str, blocks:Iterable[Block]):
 		if not self._load(value):
 			raise ValueError(f'Enum tag {self} has no value "{value}"')
 		self._contents[value].remove(blocks)
 		self._edited.add(value)
+		self._changed()
+		self._library._reindex(self._tag, value, self._contents[value], blocks)
 
 	def values(self):
-		folder = self._library._get_folder(self)
-		if folder and folder.exists():
-			for p in folder.iterdir():
-				if p.suffix == '.tsv' and p.stem not in self._contents:
-					self._contents[p.stem] = None
-		return self._contents.keys()
+		for value in self._library._enum_values(self._tag):
+			if value not in self._contents:
+				self._contents[value] = None
+		return list(self._contents.keys())
 	
 	def add_value(self, value:str):
 		if value in self.values():
@@ -223,12 +616,17 @@ class EnumTag(Tag):
 		
 		self._contents[value] = BlockCollection()
 		self._edited.add(value)
+		self._library._edit_values(self._tag, add=[value])
+		self._changed()
 
 	def remove_value(self, value:str):
 		if value not in self.values():
 			raise ValueError(f'Enum tag {self} has no value "{value}"')
 		del self._contents[value]
 		self._edited.add(value)
+		self._library._edit_values(self._tag, remove=[value])
+		self._changed()
+		self._library._unindex()
 	
 	def save(self):
 		if not self._library.folder:
@@ -236,14 +634,19 @@ class EnumTag(Tag):
 		
 		if self.parent():
 			self.parent().save()
-		
+		if not self._library._queue_save(self):
+			self._write()
+	
+	def _write(self):
 		for value in self._edited:
 			if value in self._contents: # Modified contents
 				print(f'Saving {self}:{value}')
 				self._save_file(value, self._contents[value] or BlockCollection())
 			else:
 				print(f'Unlinking {self}:{value}')
-				self._file(value).unlink()
+				self._file(value).unlink(missing_ok=True)
+		self._edited.clear()
+		self._library._sync_values(self._tag, self.values())
 	
 	def delete(self):
 		self._delete()
@@ -1,4 +1,9 @@
-from core.block import BlockCollection
+from __future__ import annotations
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+import time
+from typing import Dict, List, Tuple
+
+from core.block import BlockCollection, BlockSpace, StateDomain
 from core.tag import EnumTag, TagLibrary
 from evaluation.parser import parse, BinaryOperator, Identity
 
@@ -14,6 +19,13 @@ def _intersection(left:BlockCollection, right:BlockCollection):
 def _xor(left:BlockCollection, right:BlockCollection):
 	return left.union(right) - left.intersection(right)
 
+_OPERATORS = {
+	'union': _union,
+	'difference': _difference,
+	'intersection': _intersection,
+	'xor': _xor
+}
+
 def _evaluateIdentity(ident:Identity, library:TagLibrary):
 	tag = library.get(ident.tag)
 	if isinstance(tag, EnumTag) and ident.value:
@@ -21,23 +33,157 @@ def _evaluateIdentity(ident:Identity, library:TagLibrary):
 	else:
 		return tag.get()
 		
-def _evaluateOperator(op: BinaryOperator, library:TagLibrary):
-	left = evaluate(op.left, library)
-	right = evaluate(op.right, library)
-	result = {
-		'union': _union,
-		'difference': _difference,
-		'intersection': _intersection,
-		'xor': _xor
-	}[op.op](left, right)
-	return result
+def _evaluateOperator(op: BinaryOperator, library:TagLibrary, domains, cache, executor):
+	if executor is None or isinstance(op.right, BlockCollection):
+		left = evaluate(op.left, library, domains, cache, executor)
+		right = evaluate(op.right, library, domains, cache, executor)
+	else:
+		future = executor.submit(_tracked, op.right, library, domains, cache, executor)
+		left = evaluate(op.left, library, domains, cache, executor)
+		if future.cancel():
+			# Nobody picked it up yet; waiting for a free worker could deadlock a full pool
+			right = evaluate(op.right, library, domains, cache, executor)
+		else:
+			right, sources = future.result()
+			library.depend_on(sources)
+	return _OPERATORS[op.op](left, right)
 
-def evaluate(expression, library:TagLibrary):
+def evaluate(expression, library:TagLibrary, domains:Dict[Tuple[str, str], StateDomain] = None, cache:Dict[object, BlockCollection|BlockSpace] = None, executor:Executor = None, profile:bool = False):
+	"""Evaluate a tag expression against the library.
+	
+	If domains are given, the expression is evaluated exactly as a BlockSpace.
+	If a cache is given, every node is evaluated once across calls sharing it;
+	use parse_all so identical subexpressions are the same node.
+	If an executor is given, the right side of every operator is evaluated on it,
+	concurrently with the left side.
+	If profile is set, returns (result, Profile), evaluating sequentially without a cache."""
 	if isinstance(expression, str):
 		expression = parse(expression)
+	if profile:
+		return _profile(expression, library, domains)
+	if cache is None or isinstance(expression, BlockCollection):
+		return _evaluate(expression, library, domains, cache, executor)
+	# Nodes are cached with the tag versions they read, so a cache hit is tracked like an evaluation
+	if executor is None:
+		if expression not in cache:
+			cache[expression] = _tracked(expression, library, domains, cache, executor, _evaluate)
+		result, sources = cache[expression]
+	else:
+		# Concurrent evaluations of the same node wait for the first one instead of repeating it
+		future = Future()
+		existing = cache.setdefault(expression, future)
+		if existing is future:
+			try:
+				future.set_result(_tracked(expression, library, domains, cache, executor, _evaluate))
+			except BaseException as e:
+				future.set_exception(e)
+				raise
+		result, sources = existing.result()
+	library.depend_on(sources)
+	return result.copy()
+
+def evaluate_all(expressions:Dict[str, object], library:TagLibrary, domains:Dict[Tuple[str, str], StateDomain] = None, workers:int = None, sources:Dict[str, Dict[str, int]] = None):
+	"""Evaluate several expressions concurrently on a pool of worker threads, sharing one cache.
+	
+	If sources is given, the tag versions each expression read are collected into it."""
+	cache = dict()
+	with ThreadPoolExecutor(workers) as executor:
+		futures = {key: executor.submit(_tracked, expression, library, domains, cache, executor) for (key, expression) in expressions.items()}
+		results = dict()
+		for key, future in futures.items():
+			results[key], read = future.result()
+			library.depend_on(read)
+			if sources is not None:
+				sources[key] = read
+		return results
+
+def _tracked(expression, library:TagLibrary, domains, cache, executor, evaluator = evaluate):
+	"""Evaluate, returning the tag versions read so the caller (maybe on another thread) can track them."""
+	with library.tracking() as sources:
+		result = evaluator(expression, library, domains, cache, executor)
+	return (result, sources)
+
+def _evaluate(expression, library:TagLibrary, domains, cache, executor):
 	if isinstance(expression, BinaryOperator):
-		return _evaluateOperator(expression, library)
+		return _evaluateOperator(expression, library, domains, cache, executor)
 	elif isinstance(expression, Identity):
-		return _evaluateIdentity(expression, library)
+		result = _evaluateIdentity(expression, library)
 	else: # BlockCollection
-		return expression
\ No newline at end of file
+		result = expression.copy()
+	if domains is not None and not isinstance(result, BlockSpace):
+		return BlockSpace.from_collection(result, domains)
+	return result
+
+class Profile:
+	"""How evaluating one node of an expression went.
+	
+	seconds includes the time spent on children. source is where an Identity's blocks came from:
+	'disk' if any tag file was parsed, 'snapshot' if files came from the snapshot,
+	'memo' if the result was memoized and 'memory' if it was computed from tags already loaded."""
+	def __init__(self, node, seconds:float, inputs:List[int], output:int, source:str = None, reads:Dict[str, int] = None, children:List[Profile] = []):
+		self.node = node
+		self.seconds = seconds
+		self.inputs = inputs
+		self.output = output
+		self.source = source
+		self.reads = reads
+		self.children = children
+	
+	@property
+	def label(self):
+		if isinstance(self.node, BinaryOperator):
+			return self.node.op
+		if isinstance(self.node, Identity):
+			return f'{self.node.tag}:{self.node.value}' if self.node.value else self.node.tag
+		return f'[{" ".join(str(block) for block in self.node)}]'
+	
+	def to_json(self):
+		result = {'node': self.label, 'seconds': self.seconds, 'inputs': self.inputs, 'output': self.output}
+		if self.source:
+			result['source'] = self.source
+			result['reads'] = self.reads
+		if self.children:
+			result['children'] = [child.to_json() for child in self.children]
+		return result
+	
+	def format(self):
+		"""Render the profile as an indented tree, one node per line."""
+		return '\n'.join(self._lines('', ''))
+	
+	def _lines(self, first:str, rest:str):
+		line = f'{first}{self.label}  {self.seconds * 1000:.2f} ms  '
+		if self.inputs:
+			line += f'{" ".join(str(size) for size in self.inputs)} -> '
+		line += str(self.output)
+		if self.source:
+			line += f'  ({self.source})'
+		yield line
+		for i, child in enumerate(self.children):
+			last = i == len(self.children) - 1
+			yield from child._lines(rest + ('└─ ' if last else '├─ '), rest + ('   ' if last else '│  '))
+	
+	def __str__(self):
+		return self.format()
+
+def _profile(expression, library:TagLibrary, domains):
+	start = time.perf_counter()
+	if isinstance(expression, BinaryOperator):
+		left, left_profile = _profile(expression.left, library, domains)
+		right, right_profile = _profile(expression.right, library, domains)
+		inputs = [len(left), len(right)]
+		result = _OPERATORS[expression.op](left, right)
+		return result, Profile(expression, time.perf_counter() - start, inputs, len(result), children=[left_profile, right_profile])
+	if isinstance(expression, Identity):
+		with library.counting() as reads:
+			result = _evaluate(expression, library, domains, None, None)
+		if reads['disk']:
+			source = 'disk'
+		elif reads['snapshot']:
+			source = 'snapshot'
+		elif reads['memo']:
+			source = 'memo'
+		else:
+			source = 'memory'
+		return result, Profile(expression, time.perf_counter() - start, [], len(result), source, reads)
+	result = _evaluate(expression, library, domains, None, None)
+	return result, Profile(expression, time.perf_counter() - start, [], len(result))
\ No newline at end of file
@@ -57,4 +57,24 @@ def _parse(tokens:List[Token]):
 	return _expr()
 
 def parse(expression:str):
-	return _parse(lex(expression))
\ No newline at end of file
+	return _parse(lex(expression))
+
+def parse_all(expressions:Dict[str, str]):
+	"""Parse several expressions into one DAG, where identical subexpressions are the same node."""
+	nodes = dict()
+	return {key: _share(parse(expression), nodes) for (key, expression) in expressions.items()}
+
+def _share(node, nodes:Dict[tuple, object]):
+	if isinstance(node, BinaryOperator):
+		left = _share(node.left, nodes)
+		right = _share(node.right, nodes)
+		key = (node.op, id(left), id(right))
+		if key not in nodes:
+			nodes[key] = BinaryOperator(left, node.op, right)
+	elif isinstance(node, Identity):
+		key = ('identity', node.tag, node.value)
+		nodes.setdefault(key, node)
+	else: # BlockCollection
+		key = ('literal', frozenset(node))
+		nodes.setdefault(key, node)
+	return nodes[key]
\ No newline at end of file
@@ -0,0 +1,131 @@
+from typing import Dict, List
+
+from core.tag import EnumTag, TagLibrary
+from .parser import BinaryOperator, Identity, _share
+
+def plan(expression, library:TagLibrary, exact:bool = False):
+	"""Rewrite a parsed expression into an equivalent one that is cheaper to evaluate.
+
+	Unions and intersections are flattened and their operands ordered by estimated size,
+	intersections are pushed below unions, and chained differences are merged into one.
+	Intersections are only pushed below differences when evaluating exactly,
+	since BlockCollection.remove only removes blocks that are children of the removed ones.
+	
+	Differences are deliberately not pushed into unions: (a + b) - c as (a - c) + (b - c) subtracts c
+	once per term, and removing is a pass over c whatever it is removed from, so that only pays off
+	when c shares no blocks with some terms, which tag sizes cannot tell."""
+	return _Planner(library, exact).plan(expression)
+
+def plan_all(expressions:Dict[str, object], library:TagLibrary, exact:bool = False):
+	"""Plan several expressions, keeping identical subexpressions shared."""
+	planner = _Planner(library, exact)
+	nodes = dict()
+	return {key: _share(planner.plan(expression), nodes) for (key, expression) in expressions.items()}
+
+class _Planner:
+	def __init__(self, library:TagLibrary, exact:bool):
+		self.library = library
+		self.exact = exact
+		self.sizes:Dict[str, int] = dict()
+
+	def plan(self, node):
+		if not isinstance(node, BinaryOperator):
+			return node
+		if node.op == 'union':
+			operands = [self.plan(operand) for operand in self._flatten(node, 'union')]
+			return self._chain('union', operands)
+		if node.op == 'intersection':
+			operands = [self.plan(operand) for operand in self._flatten(node, 'intersection')]
+			return self._intersect(operands)
+		if node.op == 'difference':
+			# a - b - c is a - (b + c): one pass over a, whatever the subtrahends overlap
+			subtrahends = []
+			while isinstance(node, BinaryOperator) and node.op == 'difference':
+				subtrahends.extend(self._flatten(node.right, 'union'))
+				node = node.left
+			return BinaryOperator(self.plan(node), 'difference', self.plan(self._chain('union', subtrahends)))
+		return BinaryOperator(self.plan(node.left), node.op, self.plan(node.right))
+
+	def _intersect(self, operands:List[object]):
+		"""Intersect the smallest operands first, then distribute the result into unions (and differences, if exact)."""
+		operands = self._sorted(operands)
+		narrow = [operand for operand in operands if not self._distributes(operand)]
+		wide = [operand for operand in operands if self._distributes(operand)]
+		if not narrow:
+			narrow, wide = [wide[0]], wide[1:]
+		result = self._chain('intersection', narrow)
+		for operand in wide:
+			result = self._push(result, operand)
+		return result
+
+	def _distributes(self, node):
+		if not isinstance(node, BinaryOperator):
+			return False
+		return node.op == 'union' or (self.exact and node.op == 'difference')
+
+	def _push(self, narrow, node):
+		"""Intersect narrow with node, as deep into node as it can go."""
+		if isinstance(node, BinaryOperator) and node.op == 'union':
+			return self._chain('union', [self._push(narrow, operand) for operand in self._flatten(node, 'union')])
+		if self.exact and isinstance(node, BinaryOperator) and node.op == 'difference':
+			return BinaryOperator(self._push(narrow, node.left), 'difference', node.right)
+		return self._chain('intersection', self._sorted([narrow, node]))
+
+	def _chain(self, op:str, operands:List[object]):
+		"""Combine the operands left to right. Unions insert the smaller operands into the largest one."""
+		operands = _unique(operands)
+		if op == 'union':
+			operands = self._sorted(operands)[::-1]
+		else:
+			operands = self._sorted(operands)
+		result = operands[0]
+		for operand in operands[1:]:
+			result = BinaryOperator(result, op, operand)
+		return result
+
+	def _flatten(self, node, op:str):
+		if isinstance(node, BinaryOperator) and node.op == op:
+			return self._flatten(node.left, op) + self._flatten(node.right, op)
+		return [node]
+
+	def _sorted(self, operands:List[object]):
+		return sorted(operands, key=lambda operand: (self._estimate(operand), _signature(operand)))
+
+	def _estimate(self, node):
+		"""Estimate the number of blocks the node evaluates to."""
+		if isinstance(node, BinaryOperator):
+			left = self._estimate(node.left)
+			right = self._estimate(node.right)
+			return {
+				'union': left + right,
+				'difference': left,
+				'intersection': min(left, right),
+				'xor': left + right
+			}[node.op]
+		if isinstance(node, Identity):
+			key = _signature(node)
+			if key not in self.sizes:
+				tag = self.library.get(node.tag)
+				if isinstance(tag, EnumTag) and node.value:
+					self.sizes[key] = len(tag.get(node.value))
+				else:
+					self.sizes[key] = len(tag.get())
+			return self.sizes[key]
+		return len(node)
+
+def _unique(operands:List[object]):
+	seen = set()
+	result = []
+	for operand in operands:
+		key = _signature(operand)
+		if key not in seen:
+			seen.add(key)
+			result.append(operand)
+	return result
+
+def _signature(node):
+	if isinstance(node, BinaryOperator):
+		return f'({_signature(node.left)} {node.op} {_signature(node.right)})'
+	if isinstance(node, Identity):
+		return f'{node.tag}:{node.value}' if node.value else node.tag
+	return f'[{" ".join(sorted(str(block) for block in node))}]'
\ No newline at end of file
@@ -1,76 +1,323 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import glob
+from itertools import repeat
 import json
 from pathlib import Path
 import sys
-from typing import Dict, FrozenSet, List
+import time
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
 
-from core.block import BlockCollection
+from core.block import Block, BlockCollection, BlockSpace, StateDomain
 from core.tag import TagLibrary
-from evaluation.evaluator import evaluate
+from evaluation.evaluator import evaluate, evaluate_all
+from evaluation.parser import parse, parse_all
+from evaluation.planner import plan, plan_all
+from export_cache import ExportCache
 from mixins.register import register_all_mixins
 
 DATA_DIR = './data'
 library = TagLibrary(DATA_DIR)
 register_all_mixins(library)
-LINE_UP = '\033[1A'
-LINE_CLEAR = '\x1b[2K'
-
-def swizzle(a:BlockCollection, b:BlockCollection):
-	both = a.intersection(b)
-	return (a - b, b - a, both)
-
-def bake_masks(states:Dict[str, str]):
-	result:Dict[FrozenSet[str], BlockCollection] = dict()
-	print('Evaluating flags...')
-	queue = [(frozenset([key]), evaluate(expr, library)) for (key, expr) in states.items()]
-	num_keys = len(queue)
-	i = 1
+
+def evaluate_flags(states:Dict[str, str], domains:Dict[Tuple[str, str], StateDomain] = None, optimize:bool = False, threads:int = None, cache:ExportCache = None):
+	options = (domains is not None, optimize)
+	results = _cached_flags(states, options, cache)
+	stale = {key: expr for (key, expr) in states.items() if key not in results}
+	if stale:
+		evaluated, sources = _evaluate_stale(stale, domains, optimize, threads)
+		results.update(evaluated)
+		_cache_flags(stale, results, sources, options, cache)
+	return {key: results[key] for key in states}
+
+def _evaluate_stale(states:Dict[str, str], domains:Dict[Tuple[str, str], StateDomain] = None, optimize:bool = False, threads:int = None):
+	"""Evaluate the flags, returning their results and the tag versions each of them read."""
+	expressions = parse_all(states)
+	if optimize:
+		expressions = plan_all(expressions, library, domains is not None)
+	sources:Dict[str, Dict[str, int]] = dict()
+	if threads:
+		return (evaluate_all(expressions, library, domains, threads, sources), sources)
+	nodes = dict()
+	results:Dict[str, BlockCollection|BlockSpace] = dict()
+	for key, expr in expressions.items():
+		with library.tracking() as sources[key]:
+			results[key] = evaluate(expr, library, domains, nodes)
+	return (results, sources)
+
+def _cached_flags(states:Dict[str, str], options:tuple, cache:ExportCache):
+	results:Dict[str, BlockCollection|BlockSpace] = dict()
+	if cache is None:
+		return results
+	for key, expr in states.items():
+		result = cache.get(expr, options)
+		if result is not None:
+			results[key] = result
+	if results:
+		print(f'Reusing {len(results)} unchanged flags.')
+	return results
+
+def _cache_flags(states:Dict[str, str], results:Dict[str, BlockCollection|BlockSpace], sources:Dict[str, Dict[str, int]], options:tuple, cache:ExportCache):
+	if cache is None:
+		return
+	# Exact results also depend on the tags the domains are read from, since they decide which bases get a domain
+	domain_sources = _domain_sources() if options[0] else dict()
+	for key, expr in states.items():
+		cache.put(expr, options, results[key], sources[key].keys() | domain_sources.keys())
+
+def _domain_sources():
+	"""Collect the versions of the tags the registered domains are read from."""
+	with library.tracking() as sources:
+		library.domains()
+	return sources
+
+def _preload_snapshot():
+	"""Preload the library and save its snapshot, so every worker process reads the same compiled tags."""
+	print('Preloading library...')
+	library.preload()
+	library.save_snapshot()
+
+def _evaluate_in_processes(states:Dict[str, str], exact:bool, optimize:bool, jobs:int, executor:ProcessPoolExecutor, cache:ExportCache):
+	flags = _cached_flags(states, (exact, optimize), cache)
+	stale = {key: expr for (key, expr) in states.items() if key not in flags}
+	if stale:
+		print(f'Evaluating flags in {jobs} processes...')
+		items = list(stale.items())
+		sources:Dict[str, Dict[str, int]] = dict()
+		for results, read in executor.map(_evaluate_chunk, [dict(items[i::jobs]) for i in range(jobs)], repeat(exact), repeat(optimize)):
+			flags.update(results)
+			sources.update(read)
+		_cache_flags(stale, flags, sources, (exact, optimize), cache)
+	return {key: flags[key] for key in states}
+
+def _partition_in_processes(flags:Dict[str, BlockCollection|BlockSpace], exact:bool, jobs:int, executor:ProcessPoolExecutor):
+	"""Partition the blocks of the flags in the worker processes, sharded by block. The masks are the same as bake returns."""
+	print('Baking masks...')
+	order = _listing_order(flags) if not exact else None
+	shards = _shard(flags, jobs)
+	grouped:Dict[FrozenSet[str], List[Block]] = dict()
+	for shard_grouped, shard_order in executor.map(_bake_shard, shards, [_shard_order(shard, order) for shard in shards], repeat(exact)):
+		for keys, blocks in shard_grouped.items():
+			grouped.setdefault(keys, []).extend(blocks)
+		if order is not None:
+			order.update(shard_order)
+	if exact:
+		# List the blocks in the order a single BlockSpace.partition would
+		rank:Dict[Tuple[str, str], int] = dict()
+		for space in flags.values():
+			for base in space.bases():
+				rank.setdefault(base, len(rank))
+		result = {keys: BlockCollection(sorted(blocks, key=lambda block: rank[(block.namespace, block.name)])) for (keys, blocks) in grouped.items()}
+	else:
+		result = {keys: _listed(blocks, order) for (keys, blocks) in grouped.items()}
+	return {k:v for (k,v) in result.items() if len(v)}
+
+def _evaluate_chunk(states:Dict[str, str], exact:bool, optimize:bool):
+	return _evaluate_stale(states, library.domains() if exact else None, optimize)
+
+def _shard(flags:Dict[str, BlockCollection|BlockSpace], count:int):
+	"""Split every flag into count flags over disjoint sets of blocks, dealing the blocks out by base."""
+	shard_of:Dict[Tuple[str, str], int] = dict()
+	shards:List[Dict[str, BlockCollection|BlockSpace]] = [dict() for _ in range(count)]
+	for key, blocks in flags.items():
+		if isinstance(blocks, BlockSpace):
+			bases:List[List[Tuple[str, str]]] = [[] for _ in range(count)]
+			for base in blocks.bases():
+				bases[shard_of.setdefault(base, len(shard_of) % count)].append(base)
+			for shard, shard_bases in zip(shards, bases):
+				shard[key] = blocks.restricted(shard_bases)
+		else:
+			parts:List[List[Block]] = [[] for _ in range(count)]
+			for block in blocks:
+				parts[shard_of.setdefault((block.namespace, block.name), len(shard_of) % count)].append(block)
+			for shard, part in zip(shards, parts):
+				shard[key] = BlockCollection(part)
+	return shards
+
+def _shard_order(shard:Dict[str, BlockCollection], order:Dict[Block, Tuple[int, ...]]):
+	if order is None:
+		return None
+	return {block: order[block] for blocks in shard.values() for block in blocks}
+
+def _bake_shard(shard:Dict[str, BlockCollection|BlockSpace], order:Dict[Block, Tuple[int, ...]], exact:bool):
+	if exact:
+		domains = library.domains()
+		return ({keys: list(space.to_collection()) for (keys, space) in BlockSpace.partition(shard, domains).items()}, None)
+	grouped = _group(shard, order)
+	return (grouped, order)
+
+def bake(flags:Dict[str, BlockCollection|BlockSpace], domains:Dict[Tuple[str, str], StateDomain] = None):
+	"""Split the evaluated flags into disjoint masks, keyed by the flags each mask has.
+	
+	Every block (or with domains, every state) is grouped by the set of flags containing it,
+	in one pass over the flags."""
 	print('Baking masks...')
-	while queue:
-		key, blocks = queue.pop()
-		if len(key) == 1:
-			if i > 1:
-				print(LINE_UP, end=LINE_CLEAR)
-			print(f'    {list(key)[0]} ({i}/{num_keys})')
-			i += 1
-		for key_v in list(result.keys()):
-			both_key = key_v.union(key)
-			if both_key == key or both_key == key_v:
-				continue
-			result[key_v], blocks, both = swizzle(result[key_v], blocks)
-			if both:
-				queue.append((key_v.union(key), both))
-		if blocks:
-			result[key] = blocks
-	print(LINE_UP, end=LINE_CLEAR)
+	if domains is not None:
+		spaces = {key: BlockSpace.from_collection(blocks, domains) if isinstance(blocks, BlockCollection) else blocks for (key, blocks) in flags.items()}
+		result = {keys: space.to_collection() for (keys, space) in BlockSpace.partition(spaces, domains).items()}
+	else:
+		result = _partition(flags)
 	return {k:v for (k,v) in result.items() if len(v)}
 
+def _partition(flags:Dict[str, BlockCollection]):
+	"""Group the blocks of the flags, and every intersection between them, by the flags that contain them.
+	
+	A block only belongs to the flags with a block it is a child of, so like BlockCollection.remove,
+	a broad block keeps the flags it has even where narrower blocks have more."""
+	order = _listing_order(flags)
+	return {keys: _listed(blocks, order) for (keys, blocks) in _group(flags, order).items()}
+
+def _listing_order(flags:Dict[str, BlockCollection]):
+	"""Where each block of the flags is listed in its mask: blocks of later flags first."""
+	order:Dict[Block, Tuple[int, ...]] = dict()
+	for blocks in reversed(flags.values()):
+		for block in blocks:
+			order.setdefault(block, (len(order),))
+	return order
+
+def _group(flags:Dict[str, BlockCollection], order:Dict[Block, Tuple[int, ...]]):
+	"""Group the blocks and their intersections by the flags that contain them, listing each intersection in order."""
+	# base -> block -> the flags it came from
+	patterns:Dict[Tuple[str, str], Dict[Block, Set[str]]] = dict()
+	for key, blocks in flags.items():
+		for block in blocks:
+			patterns.setdefault((block.namespace, block.name), dict()).setdefault(block, set()).add(key)
+	grouped:Dict[FrozenSet[str], List[Block]] = dict()
+	for base_patterns in patterns.values():
+		for block in _intersections(list(base_patterns.keys()), order):
+			keys = frozenset(key for (pattern, pattern_keys) in base_patterns.items() if block <= pattern for key in pattern_keys)
+			grouped.setdefault(keys, []).append(block)
+	return grouped
+
+def _listed(blocks:List[Block], order:Dict[Block, Tuple[int, ...]]):
+	return BlockCollection(sorted(blocks, key=order.__getitem__), verify=True)
+
+def _intersections(blocks:List[Block], order:Dict[Block, Tuple[int, ...]]):
+	"""Return the blocks of one base, along with every intersection of two or more of them."""
+	originals = set(blocks)
+	closure = dict.fromkeys(blocks)
+	frontier = blocks
+	while frontier:
+		found = []
+		for a in frontier:
+			for b in list(closure):
+				both = a & b
+				if both is None or both in originals:
+					continue
+				# Intersections are listed after the blocks they came from
+				key = tuple(sorted(set(order[a]) | set(order[b]), reverse=True))
+				if both not in closure:
+					closure[both] = None
+					found.append(both)
+					order[both] = key
+				else:
+					order[both] = min(order[both], key)
+		frontier = found
+	return list(closure)
+
 def _set_key(states:List[str]):
 	def key(a:FrozenSet[str]):
 		return tuple(sorted([states.index(x) for x in a]))
-
+	
 	return key
 
-def generate_properties_file(path:Path, masks:Dict[FrozenSet[str], BlockCollection], config:dict):
+# How generated decoders find the flags of an id:
+# chain compares the id against every id with the flag, bits reads the flag's bit of id - start_index,
+# and table looks the id up in a packed constant array of flag bits.
+ID_ENCODINGS = ('chain', 'bits', 'table')
+# How masks are ordered when numbered: flags sorts them by the flags they have,
+# ranges keeps each flag's ids together so the decoder can compare against ranges.
+ID_ORDERS = ('flags', 'ranges')
+# The largest block id every shader loader accepts
+MAX_ID = 65535
+
+def _id_encoding(config:dict):
+	encoding = config.get('id_encoding', 'chain')
+	if encoding not in ID_ENCODINGS:
+		raise ValueError(f'Unknown id_encoding "{encoding}"; expected one of: {", ".join(ID_ENCODINGS)}')
+	return encoding
+
+def _id_order(config:dict):
+	order = config.get('id_order', 'flags')
+	if order not in ID_ORDERS:
+		raise ValueError(f'Unknown id_order "{order}"; expected one of: {", ".join(ID_ORDERS)}')
+	return order
+
+def _line_width(config:dict):
+	width = config.get('line_width') or 0
+	if not isinstance(width, int) or width < 0:
+		raise ValueError(f'Invalid line_width "{width}"; expected a positive number of characters')
+	return width
+
+def assign_ids(masks:Dict[FrozenSet[str], BlockCollection], config:dict):
+	"""Number the masks, returning id -> mask in the order they are listed."""
 	states = list(config['flags'].keys())
 	start_index = config['start_index'] or 1
+	ordered = sorted(masks.keys(), key=_set_key(states))
+	if _id_order(config) == 'ranges':
+		ordered = order_ranges(ordered, states)
+	if _id_encoding(config) == 'bits':
+		mapping = {start_index + sum(1 << states.index(flag) for flag in mask): mask for mask in ordered}
+	else:
+		mapping = {start_index + i: mask for (i, mask) in enumerate(ordered)}
+	if mapping and max(mapping) > MAX_ID:
+		print(f'Warning: block ids go up to {max(mapping)}, past {MAX_ID}.')
+	return mapping
+
+def order_ranges(masks:List[FrozenSet[str]], states:List[str]):
+	"""Reorder the masks so the ids of each flag form as few contiguous ranges as possible.
 	
-	lines = [
-		"## This file has been automatically generated. Please do not modify manually.",
-		"## Generated by Lowell's BlockProperties Utility v1.0 - https://github.com/camplowell/block_properties",
-		""
-	]
-	i = start_index
-	mapping:Dict[int, FrozenSet[str]] = dict()
-	for mask in sorted(masks.keys(), key=_set_key(states)):
-		blocks = masks[mask]
-		lines.append(f'\n# {", ".join(sorted(mask, key=lambda x: states.index(x)))}')
-		lines.append(f'block.{i} = {repr(blocks)}')
-		mapping[i] = mask
-		i += 1
-	
-	with path.open('w') as writer:
-		writer.write('\n'.join(lines))
+	A flag starts a range at every mask that has it when the previous one does not. With an empty mask
+	before the first and after the last, that makes the total number of ranges half the Hamming distance
+	walked through the masks, so this is a travelling salesman tour: nearest neighbour, then 2-opt."""
+	if len(masks) < 3:
+		return list(masks)
+	bits = {mask: sum(1 << states.index(flag) for flag in mask) for mask in masks}
+	def distance(a:int, b:int):
+		return (a ^ b).bit_count()
+	# Nearest neighbour, breaking ties by the order the masks were given in
+	path = [0]
+	remaining = [bits[mask] for mask in masks]
+	while remaining:
+		nearest = min(range(len(remaining)), key=lambda i: distance(path[-1], remaining[i]))
+		path.append(remaining.pop(nearest))
+	path.append(0)
+	# 2-opt: reverse any stretch of the path that makes it shorter
+	improved = True
+	while improved:
+		improved = False
+		for i in range(1, len(path) - 2):
+			for j in range(i + 1, len(path) - 1):
+				before = distance(path[i - 1], path[i]) + distance(path[j], path[j + 1])
+				after = distance(path[i - 1], path[j]) + distance(path[i], path[j + 1])
+				if after < before:
+					path[i:j + 1] = reversed(path[i:j + 1])
+					improved = True
+	by_bits = {value: mask for (mask, value) in bits.items()}
+	ordered = [by_bits[value] for value in path[1:-1]]
+	if _ranges(ordered, bits) > _ranges(masks, bits):
+		return list(masks)
+	return ordered
+
+def _ranges(masks:List[FrozenSet[str]], bits:Dict[FrozenSet[str], int]):
+	"""The total number of contiguous ranges of ids of every flag, if the masks are numbered in this order."""
+	path = [0] + [bits[mask] for mask in masks] + [0]
+	return sum((a ^ b).bit_count() for (a, b) in zip(path, path[1:])) // 2
+
+def generate_properties_file(path:Path, masks:Dict[FrozenSet[str], BlockCollection], config:dict):
+	states = list(config['flags'].keys())
+	width = _line_width(config)
+	mapping = assign_ids(masks, config)
+	
+	with _ChangedFile(path) as writer:
+		writer.line("## This file has been automatically generated. Please do not modify manually.")
+		writer.line("## Generated by Lowell's BlockProperties Utility v1.0 - https://github.com/camplowell/block_properties")
+		writer.line()
+		for i, mask in mapping.items():
+			writer.line(f'\n# {", ".join(sorted(mask, key=lambda x: states.index(x)))}')
+			writer.line(f'block.{i} = ')
+			# The game reads these as java properties, where a trailing backslash continues the value
+			writer.wrapped((str(block) for block in masks[mask]), ' ', width, ' \\', '    ')
 	
 	return mapping
 
@@ -78,44 +325,277 @@ def generate_decoder_file(path:Path, masks:Dict[FrozenSet[str], BlockCollection]
 	states = list(config['flags'].keys())
 	start_index = config['start_index'] or 1
 	decoder_pragma = config['decoder_pragma'] or 'BLOCK_PROPERTIES_DECODER'
+	encoding = _id_encoding(config)
+	width = _line_width(config)
+	
+	with _ChangedFile(path) as writer:
+		writer.line(f'#if !defined({decoder_pragma})')
+		writer.line(f'#define {decoder_pragma}')
+		writer.line()
+		writer.line("// This file has been automatically generated. Please do not modify manually.")
+		writer.line("// Generated by Lowell's BlockProperties Utility v1.0 - https://github.com/camplowell/block_properties")
+		writer.line()
+		
+		if encoding == 'table' and mapping:
+			count = max(mapping) - start_index + 1
+			for word in range(0, len(states), 32):
+				entries = [0] * count
+				for i, mask in mapping.items():
+					for flag in mask:
+						bit = states.index(flag) - word
+						if 0 <= bit < 32:
+							entries[i - start_index] |= 1 << bit
+				writer.line(f'\nconst uint {decoder_pragma}_FLAGS_{word // 32}[{count}] = uint[{count}](')
+				rows = [entries[row:row + 8] for row in range(0, count, 8)]
+				for (r, row) in enumerate(rows):
+					writer.line(f'    {", ".join(f"0x{entry:08x}u" for entry in row)}{"," if r < len(rows) - 1 else ""}')
+				writer.line(');')
+		
+		for state in states:
+			writer.line(f'\nbool {state}(int id) {{')
+			writer.line('    return ')
+			# GLSL expressions can span lines as they are, so only the preprocessor would need a backslash
+			writer.wrapped(_decode_terms(state, states, start_index, decoder_pragma, encoding, mapping, _id_order(config) == "ranges"), ' || ', width, '', '        ')
+			writer.write(';')
+			writer.line("}")
+		
+		writer.line("\n#endif // EOF")
 
-	lines = [
-		f'#if !defined({decoder_pragma})',
-		f'#define {decoder_pragma}',
-		"",
-		"// This file has been automatically generated. Please do not modify manually.",
-		"// Generated by Lowell's BlockProperties Utility v1.0 - https://github.com/camplowell/block_properties",
-		""
-	]
-
-	for state in states:
-		valid_ids = ["id == {}".format(i) for (i, mask) in mapping.items() if state in mask]
-		lines.append(f'\nbool {state}(int id) {{')
-		lines.append(f'    return {" || ".join(valid_ids) if valid_ids else "false"};')
-		lines.append( "}")
+def _decode_terms(state:str, states:List[str], start_index:int, decoder_pragma:str, encoding:str, mapping:Dict[int, FrozenSet[str]], ranges:bool = False):
+	"""The terms of the GLSL expression telling whether an id has the flag, to be joined by ||."""
+	if not any(state in mask for mask in mapping.values()):
+		return ['false']
+	index = states.index(state)
+	if encoding == 'bits':
+		end = start_index + (1 << len(states)) - 1
+		return [f'id >= {start_index} && id <= {end} && ((id - {start_index}) & {1 << index}) != 0']
+	if encoding == 'table':
+		end = max(mapping)
+		return [f'id >= {start_index} && id <= {end} && ({decoder_pragma}_FLAGS_{index // 32}[id - {start_index}] & 0x{1 << index % 32:08x}u) != 0u']
+	ids = [i for (i, mask) in mapping.items() if state in mask]
+	if not ranges:
+		return ["id == {}".format(i) for i in ids]
+	runs:List[List[int]] = []
+	for i in sorted(ids):
+		if runs and runs[-1][1] == i - 1:
+			runs[-1][1] = i
+		else:
+			runs.append([i, i])
+	if len(runs) == 1 and runs[0][0] != runs[0][1]:
+		return [f'id >= {runs[0][0]} && id <= {runs[0][1]}']
+	return [f'id == {first}' if first == last else f'(id >= {first} && id <= {last})' for (first, last) in runs]
 
-	lines.append("\n#endif // EOF")
+class _ChangedFile:
+	"""Streams lines to a temporary file beside path, which only replaces path if the contents changed.
+	
+	Lines are separated, not terminated, by newlines."""
+	def __init__(self, path:Path):
+		self.path = path
+		self.column = 0
+		self._temp = path.with_name(path.name + '.tmp')
+		self._stream = None
+		self._lines = 0
+	
+	def __enter__(self):
+		self._stream = self._temp.open('w')
+		return self
+	
+	def __exit__(self, exc_type, exc, traceback):
+		self._stream.close()
+		if exc_type is None and not (self.path.exists() and self.path.read_bytes() == self._temp.read_bytes()):
+			self._temp.replace(self.path)
+		else:
+			self._temp.unlink()
 	
-	with path.open('w') as writer:
-		writer.write('\n'.join(lines))
+	def line(self, text:str = ''):
+		if self._lines:
+			self._stream.write('\n')
+		self._lines += 1
+		self.column = 0
+		self.write(text)
 	
-def export(config:Path):
-	config = Path(config)
+	def write(self, text:str):
+		self._stream.write(text)
+		if '\n' in text:
+			self.column = len(text) - text.rfind('\n') - 1
+		else:
+			self.column += len(text)
+	
+	def wrapped(self, words:Iterable[str], separator:str, width:int, continuation:str, indent:str):
+		"""Write the words joined by separator. With a width, words that would pass it go on a new, indented line,
+		ending the previous one with the stripped separator and the continuation."""
+		end = separator.rstrip() + continuation
+		first = True
+		for word in words:
+			if first:
+				first = False
+			elif width and self.column + len(separator) + len(word) + len(end) > width:
+				self.write(end)
+				self.line(indent)
+			else:
+				self.write(separator)
+			self.write(word)
+
+def _load_config(config:Path):
 	with config.open() as config_stream:
 		config_json = json.load(config_stream)
 	print(f'Loaded configuration at {config}.')
-	config_dir = config.parent
+	return config_json
 
+def _write_outputs(config:Path, config_json:dict, masks:Dict[FrozenSet[str], BlockCollection]):
+	config_dir = config.parent
 	props_path = config_dir.joinpath(config_json['properties_file'])
 	decoder_path = config_dir.joinpath(config_json['decoder_file'])
-	
-	flags = dict(config_json['flags'])
-	states = list(flags.keys())
-	print(f'Found {len(states)} flags.')
-	masks = bake_masks(flags)
-	print(f'Outputting to disk...')
 	mapping = generate_properties_file(props_path, masks, config_json)
 	generate_decoder_file(decoder_path, masks, config_json, mapping)
+
+def export(config:Path|List[Path], exact:bool = False, preload:bool = False, watch:bool = False, optimize:bool = False, threads:int = None, jobs:int = None, no_cache:bool = False):
+	"""Export one config, or several against the same library.
+	
+	Expressions that appear in more than one config are only evaluated once, and the configs are written out concurrently."""
+	configs = [Path(config)] if isinstance(config, (str, Path)) else list(dict.fromkeys(Path(path) for path in config))
+	if watch:
+		if len(configs) != 1:
+			raise ValueError('Only one config can be watched at a time')
+		if threads or jobs:
+			raise ValueError('Watching re-evaluates flags one at a time, without threads or jobs')
+		return watch_config(configs[0], exact, preload, optimize=optimize)
+	config_jsons = [_load_config(path) for path in configs]
+	_check_outputs(configs, config_jsons)
+	
+	# Evaluate by expression rather than by flag name, so flags repeated across configs share one result
+	expressions = {expr: expr for config_json in config_jsons for expr in config_json['flags'].values()}
+	if len(configs) == 1:
+		print(f'Found {len(config_jsons[0]["flags"])} flags.')
+	else:
+		print(f'Found {len(expressions)} distinct flags in {len(configs)} configs.')
+	if preload:
+		print('Preloading library...')
+		library.preload()
+	cache = None if no_cache else ExportCache(library)
+	if jobs:
+		_preload_snapshot()
+		with ProcessPoolExecutor(jobs) as executor:
+			results = _evaluate_in_processes(expressions, exact, optimize, jobs, executor, cache)
+			masks = [_partition_in_processes(_config_flags(config_json, results), exact, jobs, executor) for config_json in config_jsons]
+	else:
+		domains = library.domains() if exact else None
+		print('Evaluating flags...')
+		results = evaluate_flags(expressions, domains, optimize, threads, cache)
+		masks = [bake(_config_flags(config_json, results), domains) for config_json in config_jsons]
+	print('Outputting to disk...')
+	with ThreadPoolExecutor(len(configs)) as executor:
+		# Consume the results so a failed write is raised here
+		list(executor.map(_write_outputs, configs, config_jsons, masks))
+	if cache is not None:
+		cache.save()
+	print('Done!')
+
+def _config_flags(config_json:dict, results:Dict[str, BlockCollection|BlockSpace]):
+	return {flag: results[expr] for (flag, expr) in config_json['flags'].items()}
+
+def _check_outputs(configs:List[Path], config_jsons:List[dict]):
+	"""Make sure no two configs would write to the same file."""
+	outputs:Dict[Path, Path] = dict()
+	for config, config_json in zip(configs, config_jsons):
+		for key in ('properties_file', 'decoder_file'):
+			path = config.parent.joinpath(config_json[key]).resolve()
+			if outputs.setdefault(path, config) != config:
+				raise ValueError(f'{config} and {outputs[path]} both write to {path}')
+
+def config_paths(arguments:List[str]):
+	"""Expand the config arguments into paths, treating arguments with wildcards as globs.
+	
+	A single path with spaces is still accepted unquoted, split across several arguments."""
+	joined = Path(' '.join(arguments))
+	if len(arguments) > 1 and joined.is_file():
+		return [joined]
+	paths:List[Path] = []
+	for argument in arguments:
+		if any(char in argument for char in '*?['):
+			matches = sorted(glob.glob(argument, recursive=True))
+			if not matches:
+				raise ValueError(f'No configs match {argument}')
+			paths.extend(Path(match) for match in matches)
+		elif Path(argument).is_file():
+			paths.append(Path(argument))
+		else:
+			raise ValueError(f'No config at {argument}')
+	return list(dict.fromkeys(paths))
+
+def watch_config(config:Path, exact:bool = False, preload:bool = False, interval:float = 1.0, optimize:bool = False):
+	"""Export whenever the config or the library changes, only re-evaluating the flags that depend on the changes.
+	
+	Flag results are kept in memory instead of the export cache. A failed export is retried on every poll,
+	so it also recovers when a missing tag is created; a config that fails to load keeps the last one that did."""
+	# flag -> (expression, versions of the tags it was derived from, result)
+	cached:Dict[str, Tuple[str, Dict[str, int], BlockCollection|BlockSpace]] = dict()
+	config_json = None
+	config_mtime = None
+	reconfigured = False
+	# The last errors, so each is only reported once however often it is retried
+	config_error = None
+	failed = None
+	if preload:
+		library.preload()
+	print(f'Watching {config} and {library.folder}. Press Ctrl+C to stop.')
+	try:
+		while True:
+			changed = library.refresh()
+			try:
+				mtime = config.stat().st_mtime_ns
+				if mtime != config_mtime:
+					config_json = _load_config(config)
+					config_mtime = mtime
+					reconfigured = True
+				config_error = None
+			except (ValueError, OSError) as e:
+				if str(e) != config_error:
+					print(f'Could not load {config}: {e}')
+				config_error = str(e)
+			if config_json is not None and (reconfigured or changed or failed is not None):
+				try:
+					# A retry writes the outputs even if no flag changed, since the failed step never did
+					_watch_step(config, config_json, cached, exact, reconfigured or failed is not None, optimize)
+					reconfigured = False
+					failed = None
+				except (ValueError, KeyError, OSError) as e:
+					if str(e) != failed:
+						print(f'Export failed: {e}')
+					failed = str(e)
+			time.sleep(interval)
+	except KeyboardInterrupt:
+		print('Stopped watching.')
+
+def _watch_step(config:Path, config_json:dict, cached:Dict[str, Tuple[str, Dict[str, int], BlockCollection|BlockSpace]], exact:bool, reconfigured:bool, optimize:bool = False):
+	flags = dict(config_json['flags'])
+	results_changed = reconfigured
+	with library.tracking() as domain_sources:
+		domains = library.domains() if exact else None
+	stale = [
+		flag for (flag, expr) in flags.items()
+		if flag not in cached or cached[flag][0] != expr or not library.is_current(cached[flag][1])
+	]
+	for flag in list(cached.keys()):
+		if flag not in flags:
+			del cached[flag]
+	if stale:
+		print(f'Re-evaluating {", ".join(stale)}...')
+	for flag in stale:
+		with library.tracking() as sources:
+			library.depend_on(domain_sources)
+			expression = parse(flags[flag])
+			if optimize:
+				expression = plan(expression, library, exact)
+			result = evaluate(expression, library, domains)
+		results_changed = results_changed or flag not in cached or cached[flag][2] != result
+		cached[flag] = (flags[flag], sources, result)
+	if not results_changed:
+		print('No flags changed.')
+		return
+	masks = bake({flag: cached[flag][2] for flag in flags}, domains)
+	print('Outputting to disk...')
+	_write_outputs(config, config_json, masks)
 	print('Done!')
 
 arg_parser = argparse.ArgumentParser(
@@ -124,9 +604,24 @@ arg_parser = argparse.ArgumentParser(
 	epilog='Nested tags are written as "parent/child" and enum tags are written as "tag:value"'
 )
 
-arg_parser.add_argument('config', type=str, nargs='+')
+arg_parser.add_argument('config', type=str, nargs='+', help='Config files to export, or globs matching them')
+arg_parser.add_argument('-p', '--preload', help='Load the whole library up front, in parallel', action='store_true')
+arg_parser.add_argument('-t', '--threads', type=int, help='Evaluate flags and their subexpressions on this many threads', metavar='N')
+arg_parser.add_argument('-w', '--watch', help='Export again whenever the config or library changes', action='store_true')
+arg_parser.add_argument('-j', '--jobs', type=int, help='Evaluate flags and bake masks in this many processes', metavar='N')
+arg_parser.add_argument('-n', '--no-cache', help='Evaluate every flag again instead of reusing unchanged results from earlier exports', action='store_true')
+arg_parser.add_argument('-O', '--optimize', help='Reorder flag expressions so they are cheaper to evaluate', action='store_true')
+arg_parser.add_argument('-x', '--exact', help='Evaluate exactly over the registered blockstate domains', action='store_true')
 
 if __name__ == "__main__":
 	args = arg_parser.parse_args()
-	args.config = ' '.join(args.config)
-	export(**args.__dict__)
\ No newline at end of file
+	try:
+		args.config = config_paths(args.config)
+	except ValueError as e:
+		arg_parser.error(str(e))
+	if args.watch and len(args.config) > 1:
+		arg_parser.error('Only one config can be watched at a time')
+	if args.watch and (args.threads or args.jobs):
+		arg_parser.error('--watch cannot be combined with --threads or --jobs')
+	export(**args.__dict__)
+	library.save_snapshot()
\ No newline at end of file
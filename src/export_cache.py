@@ -0,0 +1,105 @@
+from hashlib import sha256
+import os
+from pathlib import Path
+import pickle
+from typing import Dict, Iterable, Tuple
+
+import mixins
+from core.block import BlockCollection, BlockSpace
+from core.tag import TagLibrary
+
+CACHE_FILE = '.export_cache.pickle'
+_CACHE_VERSION = 1
+# Results no export has used in this many runs are dropped
+_KEEP_RUNS = 16
+
+class ExportCache:
+	"""Flag results from earlier exports, stored in the library folder.
+	
+	A result is reused while its expression, the options it was evaluated with, the tag files
+	of every tag it was derived from and the mixin definitions are unchanged."""
+	def __init__(self, library:TagLibrary):
+		self._library = library
+		self._path = library.folder.joinpath(CACHE_FILE) if library.folder else None
+		self._run = 0
+		# (expression, options, mixins digest) -> (digest of every tag it was derived from, last run it was used in, result)
+		self._entries:Dict[Tuple[str, tuple, str], Tuple[Dict[str, str], int, BlockCollection|BlockSpace]] = dict()
+		# Content hashes of tag files, keyed by path relative to the folder: (mtime, size, digest)
+		self._files:Dict[str, Tuple[int, int, str]] = dict()
+		self._tags:Dict[str, str] = dict()
+		self._mixins = _mixins_digest()
+		self._dirty = False
+		self._load()
+	
+	def get(self, expression:str, options:tuple = ()):
+		"""Return the cached result of the expression, or None if it is missing or stale."""
+		entry = self._entries.get((expression, options, self._mixins))
+		if entry is None:
+			return None
+		tags, run, result = entry
+		if any(self.tag_digest(tag) != digest for (tag, digest) in tags.items()):
+			return None
+		if run != self._run:
+			self._entries[(expression, options, self._mixins)] = (tags, self._run, result)
+			self._dirty = True
+		return result.copy()
+	
+	def put(self, expression:str, options:tuple, result:BlockCollection|BlockSpace, tags:Iterable[str]):
+		"""Cache the result of the expression, which was derived from the given tags."""
+		self._entries[(expression, options, self._mixins)] = ({tag: self.tag_digest(tag) for tag in tags}, self._run, result.copy())
+		self._dirty = True
+	
+	def tag_digest(self, tag:str):
+		"""Hash the names and contents of the tag files of a tag."""
+		if tag not in self._tags:
+			digest = sha256(tag.encode())
+			folder = self._path.parent.joinpath(tag) if self._path else None
+			if folder and folder.is_dir():
+				for filename in sorted(os.listdir(folder)):
+					if filename.endswith('.tsv'):
+						digest.update(b'\0' + filename.encode() + b'\0' + self._file_digest(folder.joinpath(filename)).encode())
+			self._tags[tag] = digest.hexdigest()
+		return self._tags[tag]
+	
+	def save(self):
+		"""Write the cache, dropping results that have not been used for a while."""
+		if not self._path or not self._dirty:
+			return
+		entries = {key: entry for (key, entry) in self._entries.items() if self._run - entry[1] < _KEEP_RUNS}
+		files = {key: entry for (key, entry) in self._files.items() if self._path.parent.joinpath(key).exists()}
+		temp = self._path.with_name(self._path.name + '.tmp')
+		with temp.open('wb') as stream:
+			pickle.dump((_CACHE_VERSION, self._run, entries, files), stream, protocol=pickle.HIGHEST_PROTOCOL)
+		temp.replace(self._path)
+		self._dirty = False
+	
+	def _file_digest(self, file:Path):
+		stat = file.stat()
+		key = file.relative_to(self._path.parent).as_posix()
+		entry = self._files.get(key)
+		if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+			return entry[2]
+		digest = sha256(file.read_bytes()).hexdigest()
+		self._files[key] = (stat.st_mtime_ns, stat.st_size, digest)
+		self._dirty = True
+		return digest
+	
+	def _load(self):
+		if not self._path or not self._path.exists():
+			return
+		try:
+			with self._path.open('rb') as stream:
+				version, *contents = pickle.load(stream)
+			if version == _CACHE_VERSION:
+				run, self._entries, self._files = contents
+				self._run = run + 1
+		except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+			pass # Stale or corrupt caches are rebuilt by the next export
+
+def _mixins_digest():
+	"""Hash the source of the mixins, which defines every derived tag and blockstate domain."""
+	digest = sha256()
+	folder = Path(mixins.__file__).parent
+	for file in sorted(folder.glob('*.py')):
+		digest.update(file.name.encode() + b'\0' + file.read_bytes())
+	return digest.hexdigest()
\ No newline at end of file
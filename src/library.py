@@ -1,5 +1,11 @@
 import argparse
+from contextlib import redirect_stdout
 from enum import Enum
+import json
+import os
+import socketserver
+import sys
+import threading
 from typing import List
 import shutil
 
@@ -25,9 +31,17 @@ def create_tag(tag:str, values:List[str] = []):
 	tag_.save()
 
 def edit_tag(tag:str, add:List[str], remove:List[str], force:bool):
+	try:
+		_edit_enum(tag, add, remove)
+	except ValueError as e:
+		print(e)
+		exit()
+
+def _edit_enum(tag:str, add:List[str], remove:List[str]):
+	"""Add and remove values of an enum tag, then save it."""
 	tag_ = library.get(tag)
 	if not isinstance(tag_, EnumTag):
-		print('Cannot edit non-enum tags!')
+		raise ValueError('Cannot edit non-enum tags!')
 	
 	ignore = [value for value in remove if value in add]
 	if ignore:
@@ -51,12 +65,19 @@ def delete_tag(tag:str, force:bool):
 	print('Removed!')
 
 def tag_blocks(blocks:List[str], add:List[str], remove:List[str]):
-	collection = BlockCollection.from_strings(blocks)
 	ignore = [tag for tag in remove if tag in add]
 	if ignore:
 		print('The tags {ignore} were in both add and remove; ignoring.')
 		add = [tag for tag in add if tag not in ignore]
 		remove = [tag for tag in remove if tag not in ignore]
+	try:
+		_apply_tags(BlockCollection.from_strings(blocks), add, remove)
+	except ValueError as e:
+		print(e)
+		exit()
+
+def _apply_tags(collection:BlockCollection, add:List[str], remove:List[str]):
+	"""Add and remove the blocks from tags, saving them together once all edits succeeded."""
 	# Ensure all tags exist before proceeding
 	to_save:List[BoolTag|EnumTag] = []
 	for tag in add:
@@ -68,12 +89,10 @@ def tag_blocks(blocks:List[str], add:List[str], remove:List[str]):
 			tag_.add(value, collection)
 		elif isinstance(tag_, BoolTag):
 			if value:
-				print(f'Cannot specify value for boolean tag {tag}')
-				exit()
+				raise ValueError(f'Cannot specify value for boolean tag {tag}')
 			tag_.add(collection)
 		else:
-			print(f'Tag {tag} if of unsupported type {type(tag_)}')
-			exit()
+			raise ValueError(f'Tag {tag} if of unsupported type {type(tag_)}')
 		to_save.append(tag_)
 	
 	for tag in remove:
@@ -85,22 +104,136 @@ def tag_blocks(blocks:List[str], add:List[str], remove:List[str]):
 			tag_.remove(value, collection)
 		elif isinstance(tag_, BoolTag):
 			if value:
-				print(f'Cannot specify value for boolean tag {tag}')
-				exit()
+				raise ValueError(f'Cannot specify value for boolean tag {tag}')
 			tag_.remove(collection)
 		else:
-			print(f'Tag {tag} if of unsupported type {type(tag_)}')
-			exit()
+			raise ValueError(f'Tag {tag} if of unsupported type {type(tag_)}')
 		to_save.append(tag_)
 	
-	for tag in to_save:
-		tag.save()
+	with library.session():
+		for tag in to_save:
+			tag.save()
 
-def query(expression:str):
+def query(expression:str, explain:bool = False, as_json:bool = False):
 	if isinstance(expression, list):
 		expression = ' '.join(expression)
+	if as_json:
+		result, profile = evaluate(expression, library, profile=True)
+		print(json.dumps({'result': [str(block) for block in result], 'profile': profile.to_json()}, indent='\t'))
+		return
 	print(f'Evaluating expression {expression}')
-	print(repr(evaluate(expression, library)))
+	if explain:
+		result, profile = evaluate(expression, library, profile=True)
+		print(repr(result))
+		print(profile.format())
+	else:
+		print(repr(evaluate(expression, library)))
+
+def which(blocks:List[str]):
+	for block in blocks:
+		tags = library.tags_of(Block.from_str(block))
+		print(f'{block}: {" ".join(tags) if tags else "(no tags)"}')
+
+def serve(socket:str = None):
+	"""Answer requests with a warm library, one JSON object per line.
+
+	Requests look like {"command": "query", "expression": "stairs - slab"} and are answered with
+	{"ok": true, "result": ...} or {"ok": false, "error": "..."}, echoing any "id" they had.
+	They are read from stdin and answered on stdout, or over a Unix socket if one is given."""
+	try:
+		if socket:
+			_serve_socket(socket)
+		else:
+			for line in sys.stdin:
+				if line.strip():
+					sys.stdout.write(handle_request(line) + '\n')
+					sys.stdout.flush()
+	except KeyboardInterrupt:
+		pass
+
+def _serve_socket(path:str):
+	if os.path.exists(path):
+		os.unlink(path)
+	server = socketserver.ThreadingUnixStreamServer(path, _SocketHandler)
+	server.daemon_threads = True
+	print(f'Serving {library.folder} on {path}. Press Ctrl+C to stop.', file=sys.stderr)
+	try:
+		server.serve_forever()
+	finally:
+		server.server_close()
+		os.unlink(path)
+
+class _SocketHandler(socketserver.StreamRequestHandler):
+	def handle(self):
+		for line in self.rfile:
+			if line.strip():
+				self.wfile.write((handle_request(line.decode()) + '\n').encode())
+				self.wfile.flush()
+
+_lock = threading.Lock()
+
+def handle_request(line:str):
+	"""Answer one JSON request line of the serve protocol."""
+	response = dict()
+	try:
+		request = json.loads(line)
+		if 'id' in request:
+			response['id'] = request.pop('id')
+		command = request.pop('command', None)
+		if command not in _COMMANDS:
+			raise ValueError(f'Unknown command: {command}')
+		handler, edits = _COMMANDS[command]
+		with _lock, redirect_stdout(sys.stderr):
+			library.refresh()
+			try:
+				response['result'] = handler(**request)
+			except Exception:
+				if edits:
+					# The edit may have been applied halfway; start over from the files on disk
+					_reload_library()
+				raise
+		response['ok'] = True
+	except Exception as e:
+		# Any failure only fails this request; the server keeps answering the next ones
+		response['ok'] = False
+		response['error'] = str(e)
+	return json.dumps(response)
+
+def _reload_library():
+	global library
+	library = TagLibrary(DATA_DIR)
+	register_all_mixins(library)
+
+def _serve_query(expression:str, explain:bool = False):
+	if explain:
+		result, profile = evaluate(expression, library, profile=True)
+		return {'result': [str(block) for block in result], 'profile': profile.to_json()}
+	return [str(block) for block in evaluate(expression, library)]
+
+def _serve_which(blocks:List[str]):
+	return {block: sorted(library.tags_of(Block.from_str(block))) for block in blocks}
+
+def _serve_blocks(blocks:List[str], add:List[str] = [], remove:List[str] = []):
+	_apply_tags(BlockCollection.from_strings(blocks), add, remove)
+
+def _serve_create(tag:str, values:List[str] = []):
+	create_tag(tag, values)
+
+def _serve_edit(tag:str, add:List[str] = [], remove:List[str] = []):
+	_edit_enum(tag, add, remove)
+
+def _serve_delete(tag:str):
+	library.delete(tag)
+
+# command -> (handler, whether it edits the library)
+_COMMANDS = {
+	'query': (_serve_query, False),
+	'which': (_serve_which, False),
+	'blocks': (_serve_blocks, True),
+	'create': (_serve_create, True),
+	'edit': (_serve_edit, True),
+	'delete': (_serve_delete, True),
+}
 
 arg_parser = argparse.ArgumentParser(
 	prog="library",
@@ -140,10 +273,21 @@ block_parser.set_defaults(func=tag_blocks)
 
 query_parser = subparsers.add_parser('query', help='Query the library', formatter_class=Formatter)
 query_parser.add_argument('expression', type=str, nargs='+')
+query_parser.add_argument('-e', '--explain', help='Show how long each tag and operator took, and how many blocks went in and out', action='store_true')
+query_parser.add_argument('--json', help='Print the result and its profile as JSON', action='store_true', dest='as_json')
 query_parser.set_defaults(func=query)
 
+which_parser = subparsers.add_parser('which', help='List the tags that contain blocks', formatter_class=Formatter)
+which_parser.add_argument('blocks', type=str, nargs='+', help='The blocks to look up', metavar='BLOCKS')
+which_parser.set_defaults(func=which)
+
+serve_parser = subparsers.add_parser('serve', help='Answer JSON line requests with a warm library', formatter_class=Formatter)
+serve_parser.add_argument('-s', '--socket', type=str, help='Listen on a Unix socket instead of stdin/stdout', metavar='PATH')
+serve_parser.set_defaults(func=serve)
+
 if __name__ == "__main__":
 	args = arg_parser.parse_args()
 	func = args.func
 	delattr(args, 'func')
-	func(**args.__dict__)
\ No newline at end of file
+	func(**args.__dict__)
+	library.save_snapshot()
\ No newline at end of file
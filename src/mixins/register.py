@@ -1,6 +1,18 @@
+from core.block import StateDomain
 from core.tag import TagLibrary
 from .state_mixin import StateTag
 
+STAIR_DOMAIN = StateDomain({
+	'facing': ['north', 'east', 'south', 'west'],
+	'half': ['top', 'bottom'],
+	'shape': ['straight', 'inner_left', 'inner_right', 'outer_left', 'outer_right'],
+	'waterlogged': ['true', 'false']
+})
+SLAB_DOMAIN = StateDomain({
+	'type': ['top', 'bottom', 'double'],
+	'waterlogged': ['true', 'false']
+})
+
 def register_all_mixins(library:TagLibrary):
 	register_stair_mixins(library)
 	register_slab_mixins(library)
@@ -8,6 +20,7 @@ def register_all_mixins(library:TagLibrary):
 
 def register_stair_mixins(library:TagLibrary):
 	get_stairs = lambda:library.get('stairs').get()
+	library.register_domain('stairs', STAIR_DOMAIN)
 	library.register_mixin(StateTag('stairs/solid/top', get_stairs).add_state({'half':'top'}))
 	library.register_mixin(StateTag('stairs/solid/bottom', get_stairs).add_state({'half':'bottom'}))
 	directions = ['north', 'east', 'south', 'west']
@@ -27,6 +40,7 @@ def register_stair_mixins(library:TagLibrary):
 
 def register_slab_mixins(library:TagLibrary):
 	get_slabs = lambda:library.get('slab').get()
+	library.register_domain('slab', SLAB_DOMAIN)
 	library.register_mixin(StateTag('slab/bottom', get_slabs).add_state({'type':'bottom'}))
 	library.register_mixin(StateTag('slab/top', get_slabs).add_state({'type':'top'}))
 	library.register_mixin(StateTag('slab/half', get_slabs).add_state({'type':'bottom'}).add_state({'type':'top'}))
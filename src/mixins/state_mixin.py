@@ -11,9 +11,13 @@ class StateTag(Tag):
 	
 	def add_state(self, state:Dict[str, str]):
 		self._blockstates.append(BlockState(state))
+		self._changed()
 		return self
 
 	def get(self):
+		return self._memoized(None, self._get)
+
+	def _get(self):
 		base_results = self._supplier()
 
 		result = BlockCollection()
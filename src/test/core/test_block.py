@@ -1,6 +1,7 @@
+import pickle
 import unittest
 
-from core.block import Block, BlockCollection
+from core.block import Block, BlockCollection, BlockSpace, StateDomain
 
 class TestBlock(unittest.TestCase):
 	def test_parent(self):
@@ -15,6 +16,13 @@ class TestBlock(unittest.TestCase):
 		self.assertTrue(Block.from_str('oak_stairs:half=bottom:facing=north').isChildOf(Block.from_str('oak_stairs:half=bottom')))
 		self.assertFalse(Block.from_str('oak_stairs:half=bottom').isChildOf(Block.from_str('oak_stairs:half=bottom:facing=north')))
 	
+	def test_equality(self):
+		self.assertEqual(Block.from_str('oak_stairs:half=top:facing=north'), Block.from_str('minecraft:oak_stairs:facing=north:half=top'))
+		self.assertEqual(hash(Block.from_str('oak_stairs:half=top:facing=north')), hash(Block.from_str('minecraft:oak_stairs:facing=north:half=top')))
+		self.assertNotEqual(Block.from_str('oak_stairs:half=top'), Block.from_str('oak_stairs:half=bottom'))
+		self.assertEqual(pickle.loads(pickle.dumps(Block.from_str('oak_stairs:half=top'))), Block.from_str('oak_stairs:half=top'))
+		self.assertRaises(AttributeError, lambda: setattr(Block.from_str('oak_stairs'), 'name', 'birch_stairs'))
+	
 	def test_with_state(self):
 		self.assertEqual(Block.from_str('oak_stairs').with_state({'half':'bottom'}), Block.from_str('oak_stairs:half=bottom'))
 		self.assertEqual(Block.from_str('oak_stairs:facing=north').with_state({'half':'bottom'}), Block.from_str('oak_stairs:facing=north:half=bottom'))
@@ -33,4 +41,91 @@ class TestBlockCollection(unittest.TestCase):
 		self.assertEqual(bc(['oak_stairs', 'birch_stairs']).remove(bc(['birch_stairs'])), bc(['oak_stairs']))
 		self.assertEqual(bc(['oak_stairs:half=bottom']).remove(bc(['oak_stairs:half=top'])), bc(['oak_stairs:half=bottom']))
 		self.assertEqual(bc(['oak_stairs:half=bottom', 'oak_stairs:half=top']).remove(bc(['oak_stairs:half=top'])), bc(['oak_stairs:half=bottom']))
-		self.assertEqual(bc(['oak_stairs:facing=north:half=top', 'oak_stairs:facing=north:half=bottom']).remove(bc(['oak_stairs:half=bottom'])), bc(['oak_stairs:facing=north:half=top']))
\ No newline at end of file
+		self.assertEqual(bc(['oak_stairs:facing=north:half=top', 'oak_stairs:facing=north:half=bottom']).remove(bc(['oak_stairs:half=bottom'])), bc(['oak_stairs:facing=north:half=top']))
+	
+	def test_intersection(self):
+		bc = BlockCollection.from_strings
+		self.assertEqual(bc(['oak_stairs', 'birch_stairs']).intersection(bc(['oak_stairs:half=top'])), bc(['oak_stairs:half=top']))
+		self.assertEqual(bc(['oak_stairs:half=top']).intersection(bc(['oak_stairs:half=bottom', 'birch_stairs'])), bc([]))
+		self.assertEqual(len(bc(['oak_stairs:half=top', 'oak_stairs:facing=north']).intersection(bc(['oak_stairs:half=top:facing=north']))), 1)
+	
+	def test_from_strings_verify(self):
+		bc = BlockCollection.from_strings
+		self.assertEqual(bc(['oak_stairs:half=top', 'birch_stairs', 'oak_stairs', 'birch_stairs'], verify=True), bc(['oak_stairs', 'birch_stairs']))
+		self.assertEqual(len(bc(['oak_stairs:half=top', 'oak_stairs:half=bottom', 'oak_stairs:half=top'], verify=True)), 2)
+	
+	def test_copy_on_write(self):
+		bc = BlockCollection.from_strings
+		original = bc(['oak_stairs', 'birch_stairs'])
+		copy = original.copy()
+		copy.insert(bc(['spruce_stairs'])).remove(bc(['oak_stairs']))
+		self.assertEqual(original, bc(['oak_stairs', 'birch_stairs']))
+		self.assertEqual(copy, bc(['birch_stairs', 'spruce_stairs']))
+		original.remove(bc(['birch_stairs']))
+		self.assertEqual(copy, bc(['birch_stairs', 'spruce_stairs']))
+	
+	def test_order_preserved(self):
+		bc = BlockCollection.from_strings
+		collection = bc(['oak_stairs:half=top', 'birch_stairs', 'oak_slab']).insert(bc(['oak_stairs']))
+		self.assertEqual(repr(collection), 'minecraft:oak_stairs minecraft:birch_stairs minecraft:oak_slab')
+
+STAIRS = StateDomain({'half': ['top', 'bottom'], 'facing': ['north', 'east', 'south', 'west']})
+
+class TestBlockSpace(unittest.TestCase):
+	def space(self, blocks):
+		return BlockSpace.from_collection(BlockCollection.from_strings(blocks), {('minecraft', 'oak_stairs'): STAIRS})
+
+	def test_domain(self):
+		self.assertEqual(STAIRS.size, 8)
+		self.assertEqual(STAIRS.mask(Block.from_str('oak_stairs').state), STAIRS.full)
+		self.assertEqual(len(list(STAIRS.states(STAIRS.mask(Block.from_str('oak_stairs:half=top').state)))), 4)
+		self.assertRaises(ValueError, lambda: STAIRS.mask(Block.from_str('oak_stairs:shape=straight').state))
+
+	def test_set_algebra(self):
+		stairs = self.space(['oak_stairs', 'birch_slab'])
+		top = self.space(['oak_stairs:half=top'])
+		bottom = self.space(['oak_stairs:half=bottom'])
+		self.assertEqual(stairs - top, self.space(['oak_stairs:half=bottom', 'birch_slab']))
+		self.assertEqual(top + bottom, self.space(['oak_stairs']))
+		self.assertEqual(stairs & top, top)
+		self.assertEqual(stairs ^ top, bottom + self.space(['birch_slab']))
+		self.assertEqual(len(stairs - top), 5)
+
+	def test_to_collection(self):
+		bc = BlockCollection.from_strings
+		self.assertEqual(self.space(['oak_stairs:half=top', 'oak_stairs:half=bottom']).to_collection(), bc(['oak_stairs']))
+		self.assertEqual(self.space(['oak_stairs:half=top']).to_collection(), bc(['oak_stairs:half=top']))
+
+	def test_partition(self):
+		domains = {('minecraft', 'oak_stairs'): STAIRS}
+		parts = BlockSpace.partition({'stairs': self.space(['oak_stairs', 'birch_slab']), 'top': self.space(['oak_stairs:half=top'])}, domains)
+		self.assertEqual(parts, {
+			frozenset(['stairs']): self.space(['oak_stairs:half=bottom', 'birch_slab']),
+			frozenset(['stairs', 'top']): self.space(['oak_stairs:half=top'])
+		})
+
+	def test_undomained(self):
+		bc = BlockCollection.from_strings
+		grass = self.space(['tall_grass:half=lower', 'oak_stairs'])
+		self.assertEqual((grass - self.space(['tall_grass'])).to_collection(), bc(['oak_stairs']))
+		self.assertEqual((grass & self.space(['tall_grass:half=lower:age=1'])).to_collection(), bc(['tall_grass:half=lower:age=1']))
+		self.assertEqual((grass + self.space(['tall_grass'])).to_collection(), bc(['oak_stairs', 'tall_grass']))
+		self.assertEqual(len(grass ^ self.space(['tall_grass:half=lower'])), 8)
+		parts = BlockSpace.partition({'lower': grass, 'all': self.space(['tall_grass'])}, {('minecraft', 'oak_stairs'): STAIRS})
+		self.assertEqual({keys: space.to_collection() for (keys, space) in parts.items()}, {
+			frozenset(['lower']): bc(['oak_stairs']),
+			frozenset(['lower', 'all']): bc(['tall_grass:half=lower']),
+			frozenset(['all']): bc(['tall_grass']),
+		})
+
+	def test_cover(self):
+		bc = BlockCollection.from_strings
+		self.assertEqual(self.space(['oak_stairs']).to_collection(), bc(['oak_stairs']))
+		self.assertEqual((self.space(['oak_stairs']) - self.space(['oak_stairs:half=top:facing=north'])).to_collection(), bc(['oak_stairs:half=bottom', 'oak_stairs:facing=east', 'oak_stairs:facing=south', 'oak_stairs:facing=west']))
+		self.assertEqual(len(STAIRS.cover(STAIRS.full & ~STAIRS.mask(Block.from_str('oak_stairs:facing=north').state))), 3)
+
+	def test_exact_difference(self):
+		bc = BlockCollection.from_strings
+		domains = {('minecraft', 'oak_stairs'): STAIRS}
+		self.assertEqual(bc(['oak_stairs', 'birch_slab']).exact_difference(bc(['oak_stairs:half=top']), domains), bc(['oak_stairs:half=bottom', 'birch_slab']))
+		self.assertEqual(bc(['oak_stairs:half=top']).exact_difference(bc(['oak_stairs']), domains), bc([]))
\ No newline at end of file
@@ -1,7 +1,11 @@
+from contextlib import redirect_stdout
+import io
+from pathlib import Path
+import tempfile
 import unittest
-from core.block import BlockCollection
+from core.block import Block, BlockCollection
 
-from core.tag import TagLibrary
+from core.tag import SNAPSHOT_FILE, BoolTag, EnumTag, TagLibrary
 
 
 class TestTag(unittest.TestCase):
@@ -35,4 +39,112 @@ class TestTag(unittest.TestCase):
 
 		library.create_enum('enum', ['foo', 'bar'])
 		bool_child = library.create_bool('enum/bool')
-		self.assertRaises(RuntimeError, lambda: bool_child.add(collection))
\ No newline at end of file
+		self.assertRaises(RuntimeError, lambda: bool_child.add(collection))
+	
+	def test_load_file(self):
+		with tempfile.TemporaryDirectory() as folder:
+			Path(folder, 'stairs').mkdir()
+			Path(folder, 'stairs', '_bool.tsv').write_text('oak_stairs:half=top\noak_stairs\nbirch_stairs\tbirch_stairs:half=top')
+			self.assertEqual(TagLibrary(folder).get('stairs').get(), BlockCollection.from_strings(['oak_stairs', 'birch_stairs']))
+	
+	def test_snapshot(self):
+		with tempfile.TemporaryDirectory() as folder:
+			Path(folder, 'stairs').mkdir()
+			file = Path(folder, 'stairs', '_bool.tsv')
+			file.write_text('oak_stairs')
+			library = TagLibrary(folder)
+			library.get('stairs').get()
+			library.save_snapshot()
+			self.assertTrue(Path(folder, SNAPSHOT_FILE).exists())
+
+			cached = TagLibrary(folder)
+			self.assertEqual(cached.get('stairs').get(), BlockCollection.from_strings(['oak_stairs']))
+			self.assertFalse(cached._snapshot_dirty)
+
+			file.write_text('oak_stairs\nbirch_stairs')
+			changed = TagLibrary(folder)
+			self.assertEqual(changed.get('stairs').get(), BlockCollection.from_strings(['oak_stairs', 'birch_stairs']))
+	
+	def test_preload(self):
+		with tempfile.TemporaryDirectory() as folder:
+			Path(folder, 'stairs', 'wood').mkdir(parents=True)
+			Path(folder, 'stairs', '_bool.tsv').write_text('oak_stairs\nstone_stairs')
+			Path(folder, 'stairs', 'wood', '_bool.tsv').write_text('oak_stairs')
+			Path(folder, 'sway').mkdir()
+			Path(folder, 'sway', 'lower.tsv').write_text('tall_grass:half=lower')
+			Path(folder, 'sway', 'upper.tsv').write_text('tall_grass:half=upper')
+			library = TagLibrary(folder)
+			library.preload(workers=2)
+			self.assertIsInstance(library._get_node('stairs/wood').tag, BoolTag)
+			self.assertIsInstance(library._get_node('sway').tag, EnumTag)
+			self.assertEqual(library.get('stairs/wood').get(), BlockCollection.from_strings(['oak_stairs']))
+			self.assertEqual(library.get('sway').get('upper'), BlockCollection.from_strings(['tall_grass:half=upper']))
+	
+	def test_session(self):
+		with tempfile.TemporaryDirectory() as folder:
+			library = TagLibrary(folder)
+			library.create_bool('stairs')
+			wood = library.create_bool('stairs/wood')
+			stone = library.create_bool('stairs/stone')
+			output = io.StringIO()
+			with redirect_stdout(output), library.session():
+				wood.add(BlockCollection.from_strings(['oak_stairs']))
+				wood.save()
+				stone.add(BlockCollection.from_strings(['stone_stairs']))
+				stone.save()
+				self.assertFalse(Path(folder, 'stairs', '_bool.tsv').exists())
+			self.assertEqual(output.getvalue().count('Saving stairs\n'), 1)
+			self.assertEqual(TagLibrary(folder).get('stairs').get(), BlockCollection.from_strings(['oak_stairs', 'stone_stairs']))
+
+			with self.assertRaises(KeyError), redirect_stdout(io.StringIO()), library.session():
+				stone.add(BlockCollection.from_strings(['cobblestone_stairs']))
+				stone.save()
+				raise KeyError()
+			self.assertEqual(TagLibrary(folder).get('stairs/stone').get(), BlockCollection.from_strings(['stone_stairs']))
+	
+	def test_enum_manifest(self):
+		with tempfile.TemporaryDirectory() as folder:
+			Path(folder, 'sway').mkdir()
+			Path(folder, 'sway', 'lower.tsv').write_text('tall_grass:half=lower')
+			Path(folder, 'sway', 'upper.tsv').write_text('tall_grass:half=upper')
+			library = TagLibrary(folder)
+			sway = library.get('sway')
+			self.assertEqual(set(sway.values()), {'lower', 'upper'})
+			sway.remove_value('upper')
+			sway.add_value('full')
+			self.assertEqual(set(sway.values()), {'lower', 'full'})
+			with redirect_stdout(io.StringIO()):
+				sway.save()
+			library.save_snapshot()
+			self.assertFalse(Path(folder, 'sway', 'upper.tsv').exists())
+			self.assertEqual(set(TagLibrary(folder).get('sway').values()), {'lower', 'full'})
+	
+	def test_tags_of(self):
+		library = TagLibrary()
+		library.create_bool('stairs').add(BlockCollection.from_strings(['oak_stairs', 'birch_stairs']))
+		library.create_enum('sway', ['lower', 'upper']).add('upper', BlockCollection.from_strings(['oak_stairs:half=top']))
+		self.assertEqual(library.tags_of(Block.from_str('oak_stairs:half=top')), ['stairs', 'sway:upper'])
+		self.assertEqual(library.tags_of(Block.from_str('oak_stairs')), ['stairs'])
+
+		library.get('stairs').remove(BlockCollection.from_strings(['oak_stairs']))
+		library.get('sway').add('lower', BlockCollection.from_strings(['birch_stairs']))
+		self.assertEqual(library.tags_of(Block.from_str('oak_stairs:half=top')), ['sway:upper'])
+		self.assertEqual(library.tags_of(Block.from_str('birch_stairs')), ['stairs', 'sway:lower'])
+	
+	def test_refresh(self):
+		with tempfile.TemporaryDirectory() as folder:
+			Path(folder, 'stairs').mkdir()
+			Path(folder, 'slab').mkdir()
+			Path(folder, 'stairs', '_bool.tsv').write_text('oak_stairs')
+			Path(folder, 'slab', '_bool.tsv').write_text('oak_slab')
+			library = TagLibrary(folder)
+			with library.tracking() as sources:
+				library.get('stairs').get()
+			library.get('slab').get()
+			self.assertEqual(library.refresh(), set())
+			self.assertTrue(library.is_current(sources))
+
+			Path(folder, 'stairs', '_bool.tsv').write_text('oak_stairs\nbirch_stairs')
+			self.assertEqual(library.refresh(), {'stairs'})
+			self.assertFalse(library.is_current(sources))
+			self.assertEqual(library.get('stairs').get(), BlockCollection.from_strings(['oak_stairs', 'birch_stairs']))
\ No newline at end of file
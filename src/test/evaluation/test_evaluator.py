@@ -0,0 +1,52 @@
+import unittest
+from core.block import BlockCollection
+
+from core.tag import TagLibrary
+from evaluation.evaluator import evaluate, evaluate_all
+from evaluation.parser import parse_all
+
+class TestEvaluator(unittest.TestCase):
+	def setUp(self):
+		self.library = TagLibrary()
+		self.library.create_bool('stairs').add(BlockCollection.from_strings(['oak_stairs', 'birch_stairs']))
+		self.library.create_bool('slab').add(BlockCollection.from_strings(['oak_slab']))
+
+	def test_evaluate(self):
+		bc = BlockCollection.from_strings
+		self.assertEqual(evaluate('stairs + slab', self.library), bc(['oak_stairs', 'birch_stairs', 'oak_slab']))
+		self.assertEqual(evaluate('stairs - [oak_stairs]', self.library), bc(['birch_stairs']))
+		self.assertEqual(evaluate('stairs & [oak_stairs:half=top]', self.library), bc(['oak_stairs:half=top']))
+		self.assertEqual(evaluate('stairs ^ [oak_stairs oak_slab]', self.library), bc(['birch_stairs', 'oak_slab']))
+
+	def test_shared_subexpressions(self):
+		flags = parse_all({'a': 'stairs + slab', 'b': '(stairs + slab) - [oak_slab]', 'c': 'slab'})
+		self.assertIs(flags['a'], flags['b'].left)
+		self.assertIs(flags['a'].right, flags['c'])
+
+		cache = dict()
+		results = {key: evaluate(expr, self.library, cache=cache) for (key, expr) in flags.items()}
+		self.assertEqual(len(cache), 4)
+		self.assertEqual(results['a'], BlockCollection.from_strings(['oak_stairs', 'birch_stairs', 'oak_slab']))
+		self.assertEqual(results['b'], BlockCollection.from_strings(['oak_stairs', 'birch_stairs']))
+		self.assertEqual(results['c'], BlockCollection.from_strings(['oak_slab']))
+
+	def test_parallel(self):
+		flags = parse_all({'a': 'stairs + slab', 'b': '(stairs + slab) - [oak_slab]', 'c': 'stairs & [oak_stairs] + slab'})
+		expected = {key: evaluate(expr, self.library) for (key, expr) in flags.items()}
+		for workers in [1, 4]:
+			with self.library.tracking() as sources:
+				self.assertEqual(evaluate_all(flags, self.library, workers=workers), expected)
+			self.assertEqual(set(sources.keys()), {'stairs', 'slab'})
+
+	def test_profile(self):
+		result, profile = evaluate('stairs + slab - stairs', self.library, profile=True)
+		self.assertEqual(result, evaluate('stairs + slab - stairs', self.library))
+		self.assertEqual(profile.label, 'difference')
+		self.assertEqual(profile.inputs, [3, 2])
+		self.assertEqual(profile.output, 1)
+		union, stairs = profile.children
+		self.assertEqual([child.label for child in union.children], ['stairs', 'slab'])
+		self.assertEqual(union.children[0].source, 'memory')
+		self.assertEqual(stairs.source, 'memo')
+		self.assertEqual(profile.to_json()['children'][1], {'node': 'stairs', 'seconds': stairs.seconds, 'inputs': [], 'output': 2, 'source': 'memo', 'reads': {'memo': 1, 'snapshot': 0, 'disk': 0}})
+		self.assertEqual(len(profile.format().splitlines()), 5)
\ No newline at end of file
@@ -0,0 +1,57 @@
+import unittest
+from core.block import BlockCollection, BlockSpace, StateDomain
+
+from core.tag import TagLibrary
+from evaluation.evaluator import evaluate
+from evaluation.parser import parse, BinaryOperator
+from evaluation.planner import plan
+
+STAIRS = StateDomain({'half': ['top', 'bottom'], 'facing': ['north', 'east', 'south', 'west']})
+DOMAINS = {('minecraft', name): STAIRS for name in ['oak_stairs', 'birch_stairs', 'spruce_stairs']}
+
+class TestPlanner(unittest.TestCase):
+	def setUp(self):
+		bc = BlockCollection.from_strings
+		self.library = TagLibrary()
+		self.library.create_bool('stairs').add(bc(['oak_stairs', 'birch_stairs', 'spruce_stairs']))
+		self.library.create_bool('wooden').add(bc(['oak_stairs', 'birch_stairs']))
+		self.library.create_bool('top').add(bc(['oak_stairs:half=top', 'birch_stairs:half=top', 'spruce_stairs:half=top']))
+		self.library.create_bool('north').add(bc(['oak_stairs:facing=north', 'spruce_stairs:facing=north']))
+	
+	def test_flatten(self):
+		planned = plan(parse('stairs & (top & [oak_stairs])'), self.library)
+		self.assertEqual(planned.op, 'intersection')
+		self.assertIsInstance(planned.left, BinaryOperator)
+		self.assertEqual(len(planned.left.left), 1) # the literal is intersected first
+	
+	def test_differences(self):
+		planned = plan(parse('stairs - wooden - north - wooden'), self.library)
+		self.assertEqual(planned.op, 'difference')
+		self.assertEqual(planned.left.tag, 'stairs')
+		self.assertEqual(planned.right.op, 'union')
+		self.assertEqual({planned.right.left.tag, planned.right.right.tag}, {'wooden', 'north'})
+		
+		# Mixed chains keep one difference after the union, with the subtrahends merged
+		planned = plan(parse('wooden + north - top - [oak_stairs]'), self.library)
+		self.assertEqual((planned.op, planned.left.op, planned.right.op), ('difference', 'union', 'union'))
+	
+	def test_equivalent(self):
+		expressions = [
+			'stairs + wooden + top',
+			'(stairs + [oak_stairs]) & top & north',
+			'(stairs - wooden) & top',
+			'stairs - wooden - north',
+			'wooden + north - top - [oak_stairs]',
+			'stairs - top + north - wooden',
+			'(wooden + north) & (top + [spruce_stairs:facing=east])',
+			'(stairs ^ north) - top & wooden',
+		]
+		for expression in expressions:
+			exact = evaluate(plan(parse(expression), self.library, exact=True), self.library, DOMAINS)
+			self.assertEqual(exact, evaluate(expression, self.library, DOMAINS), expression)
+			legacy = evaluate(plan(parse(expression), self.library), self.library)
+			self.assertEqual(
+				BlockSpace.from_collection(legacy, DOMAINS),
+				BlockSpace.from_collection(evaluate(expression, self.library), DOMAINS),
+				expression
+			)
\ No newline at end of file
@@ -1,5 +1,5 @@
 import unittest
-from core.block import BlockCollection
+from core.block import Block, BlockCollection
 
 from core.tag import TagLibrary
 from mixins.state_mixin import StateTag
@@ -14,4 +14,33 @@ class TestStateMixin(unittest.TestCase):
 		collection = BlockCollection.from_strings(['oak_stairs'])
 		stairs.add(collection)
 		
-		self.assertEqual(library.get('stairs/solid/bottom').get(), BlockCollection.from_strings(['oak_stairs:half=bottom']))
\ No newline at end of file
+		self.assertEqual(library.get('stairs/solid/bottom').get(), BlockCollection.from_strings(['oak_stairs:half=bottom']))
+	
+	def test_mixin_memoized(self):
+		library = TagLibrary()
+		calls = []
+		def supplier():
+			calls.append(None)
+			return library.get('stairs').get()
+		library.register_mixin(StateTag('stairs/solid/top', supplier).add_state({'half':'top'}))
+		stairs = library.create_bool('stairs')
+		stairs.add(BlockCollection.from_strings(['oak_stairs']))
+
+		library.get('stairs/solid/top').get()
+		self.assertEqual(library.get('stairs/solid/top').get(), BlockCollection.from_strings(['oak_stairs:half=top']))
+		self.assertEqual(len(calls), 1)
+
+		stairs.add(BlockCollection.from_strings(['birch_stairs']))
+		self.assertEqual(library.get('stairs/solid/top').get(), BlockCollection.from_strings(['oak_stairs:half=top', 'birch_stairs:half=top']))
+		self.assertEqual(len(calls), 2)
+	
+	def test_mixin_tags_of(self):
+		library = TagLibrary()
+		library.register_mixin(StateTag('stairs/solid/top', lambda:library.get('stairs').get()).add_state({'half':'top'}))
+		stairs = library.create_bool('stairs')
+		stairs.add(BlockCollection.from_strings(['oak_stairs']))
+		self.assertEqual(library.tags_of(Block.from_str('oak_stairs:half=top:facing=east')), ['stairs', 'stairs/solid/top'])
+		self.assertEqual(library.tags_of(Block.from_str('birch_stairs:half=top')), [])
+
+		stairs.add(BlockCollection.from_strings(['birch_stairs']))
+		self.assertEqual(library.tags_of(Block.from_str('birch_stairs:half=top')), ['stairs', 'stairs/solid/top'])
\ No newline at end of file
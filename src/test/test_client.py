@@ -0,0 +1,31 @@
+import os
+import socketserver
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import library
+from client import Client
+from core.tag import TagLibrary
+
+class TestClient(unittest.TestCase):
+	def test_socket(self):
+		with tempfile.TemporaryDirectory() as folder, mock.patch.object(library, 'library', TagLibrary(folder)):
+			path = os.path.join(folder, 'library.sock')
+			server = socketserver.ThreadingUnixStreamServer(path, library._SocketHandler)
+			server.daemon_threads = True
+			thread = threading.Thread(target=server.serve_forever)
+			thread.start()
+			try:
+				with Client(path) as client:
+					client.request('create', tag='sway')
+					client.tag(['tall_grass', 'fern'], add=['sway'])
+					self.assertEqual(client.query('sway'), ['minecraft:tall_grass', 'minecraft:fern'])
+					self.assertEqual(client.which(['fern']), {'fern': ['sway']})
+					self.assertRaises(ValueError, lambda: client.query('sway +'))
+					self.assertEqual(client.query('sway - [fern]'), ['minecraft:tall_grass'])
+			finally:
+				server.shutdown()
+				server.server_close()
+				thread.join()
\ No newline at end of file
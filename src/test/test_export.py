@@ -0,0 +1,242 @@
+import json
+import os
+import random
+from pathlib import Path
+import tempfile
+import unittest
+from unittest import mock
+from core.block import BlockCollection, StateDomain
+from core.tag import SNAPSHOT_FILE, TagLibrary
+from export_cache import ExportCache
+
+from evaluation import evaluator
+import export as export_module
+from export import _decode_terms, _evaluate_chunk, _ranges, assign_ids, bake, config_paths, evaluate_flags, export, generate_decoder_file, generate_properties_file, order_ranges
+
+class TestExport(unittest.TestCase):
+	def test_bake(self):
+		bc = BlockCollection.from_strings
+		masks = bake({
+			'stairs': bc(['oak_stairs', 'birch_stairs']),
+			'top': bc(['oak_stairs:half=top', 'birch_stairs:half=top', 'oak_slab:type=top']),
+			'north': bc(['oak_stairs:facing=north']),
+		})
+		self.assertEqual(masks, {
+			frozenset(['stairs']): bc(['oak_stairs', 'birch_stairs']),
+			frozenset(['stairs', 'top']): bc(['oak_stairs:half=top', 'birch_stairs:half=top']),
+			frozenset(['stairs', 'north']): bc(['oak_stairs:facing=north']),
+			frozenset(['stairs', 'top', 'north']): bc(['oak_stairs:facing=north:half=top']),
+			frozenset(['top']): bc(['oak_slab:type=top']),
+		})
+
+	def test_bake_overlaps(self):
+		bc = BlockCollection.from_strings
+		flags = {
+			'f0': bc(['oak_stairs', 'birch_stairs:half=bottom']),
+			'f1': bc(['birch_stairs:facing=east']),
+			'f2': bc(['birch_stairs:facing=east:half=bottom', 'birch_stairs:facing=north']),
+		}
+		# Every state is listed once, under exactly the flags containing it
+		self.assertEqual(bake(flags), {
+			frozenset(['f0']): bc(['oak_stairs', 'birch_stairs:half=bottom']),
+			frozenset(['f1']): bc(['birch_stairs:facing=east']),
+			frozenset(['f2']): bc(['birch_stairs:facing=north']),
+			frozenset(['f0', 'f2']): bc(['birch_stairs:facing=north:half=bottom']),
+			frozenset(['f0', 'f1', 'f2']): bc(['birch_stairs:facing=east:half=bottom']),
+		})
+		
+		rng = random.Random(0)
+		properties = {'half': ['top', 'bottom'], 'facing': ['north', 'east'], 'shape': ['straight', 'inner_left']}
+		def random_block():
+			return ':'.join([rng.choice(['oak_stairs', 'birch_stairs'])] + [f'{key}={rng.choice(values)}' for (key, values) in properties.items() if rng.random() < 0.5])
+		for _ in range(200):
+			flags = {f'f{i}': bc([random_block() for _ in range(rng.randint(1, 4))], verify=True) for i in range(rng.randint(2, 5))}
+			masks = bake(flags)
+			listed = [block for blocks in masks.values() for block in blocks]
+			self.assertEqual(len(listed), len(set(listed)))
+			for keys, blocks in masks.items():
+				for block in blocks:
+					self.assertEqual(keys, {key for (key, flag) in flags.items() if any(block <= parent for parent in flag)})
+			for key, flag in flags.items():
+				for block in flag:
+					self.assertTrue(any(block <= other or block >= other for (keys, blocks) in masks.items() if key in keys for other in blocks))
+
+	def test_processes(self):
+		flags = {
+			'stairs': 'stairs',
+			'top': '[oak_stairs:half=top birch_stairs:half=top oak_slab:type=top]',
+			'north': '[oak_stairs:facing=north]',
+			'slab': '[oak_slab]',
+		}
+		with tempfile.TemporaryDirectory() as folder:
+			Path(folder, 'stairs').mkdir()
+			Path(folder, 'stairs', '_bool.tsv').write_text('oak_stairs\nbirch_stairs')
+			for name in ['serial', 'jobs']:
+				with Path(folder, f'{name}.json').open('w') as stream:
+					json.dump({'properties_file': f'{name}.properties', 'decoder_file': f'{name}.glsl', 'decoder_pragma': None, 'start_index': 1, 'flags': flags}, stream)
+			with mock.patch.object(export_module, 'library', TagLibrary(folder)):
+				export(Path(folder, 'serial.json'), no_cache=True)
+				export(Path(folder, 'jobs.json'), jobs=2, no_cache=True)
+			self.assertEqual(Path(folder, 'jobs.properties').read_text(), Path(folder, 'serial.properties').read_text())
+			self.assertEqual(Path(folder, 'jobs.glsl').read_text(), Path(folder, 'serial.glsl').read_text())
+			self.assertTrue(Path(folder, SNAPSHOT_FILE).exists())
+
+	def test_cache_evaluations(self):
+		flags = {'a': 'stairs + [oak_slab]', 'b': '(stairs + [oak_slab]) - [oak_stairs]'}
+		operations = []
+		counted = {op: (lambda op, f: lambda left, right: operations.append(op) or f(left, right))(op, f) for (op, f) in evaluator._OPERATORS.items()}
+		with tempfile.TemporaryDirectory() as folder, mock.patch.dict(evaluator._OPERATORS, counted):
+			file = Path(folder, 'stairs', '_bool.tsv')
+			file.parent.mkdir()
+			file.write_text('oak_stairs\nbirch_stairs')
+			with mock.patch.object(export_module, 'library', TagLibrary(folder)) as library:
+				evaluate_flags(flags)
+				uncached = len(operations)
+				operations.clear()
+				cache = ExportCache(library)
+				results = evaluate_flags(flags, cache=cache)
+				# Collecting the tags each flag read does not evaluate anything again
+				self.assertEqual(len(operations), uncached)
+				self.assertEqual(_evaluate_chunk(flags, False, False)[1]['b'].keys(), {'stairs'})
+				cache.save()
+				
+				operations.clear()
+				self.assertEqual(evaluate_flags(flags, cache=ExportCache(library)), results)
+				self.assertEqual(operations, [])
+				
+				# b only reads stairs through the subexpression it shares with a
+				file.write_text('oak_stairs')
+				library.refresh()
+				self.assertEqual(evaluate_flags(flags, cache=ExportCache(library))['b'], BlockCollection.from_strings(['oak_slab']))
+				self.assertEqual(len(operations), uncached)
+
+	def test_cache_domains(self):
+		flags = {'a': 'stairs', 'b': '[oak_stairs:half=top]'}
+		with tempfile.TemporaryDirectory() as folder:
+			file = Path(folder, 'stairs', '_bool.tsv')
+			file.parent.mkdir()
+			file.write_text('oak_stairs\nbirch_stairs')
+			with mock.patch.object(export_module, 'library', TagLibrary(folder)) as library:
+				library.register_domain('stairs', StateDomain({'half': ['top', 'bottom']}))
+				cache = ExportCache(library)
+				evaluate_flags(flags, library.domains(), cache=cache)
+				cache.save()
+				
+				# b never reads stairs, but whether oak_stairs has a domain decides how its result is stored
+				file.write_text('birch_stairs')
+				library.refresh()
+				domains = library.domains()
+				results = evaluate_flags(flags, domains, cache=ExportCache(library))
+				self.assertEqual(results, evaluate_flags(flags, domains))
+				self.assertEqual(bake(results, domains), bake(evaluate_flags(flags, domains), domains))
+
+	def test_batch(self):
+		with tempfile.TemporaryDirectory() as folder:
+			folder = Path(folder)
+			flags = {'stairs': '[oak_stairs birch_stairs]', 'top': '[oak_stairs:half=top oak_slab:type=top]'}
+			for name in ['a', 'b']:
+				with folder.joinpath(f'{name}.json').open('w') as stream:
+					json.dump({'properties_file': f'{name}.properties', 'decoder_file': f'{name}.glsl', 'decoder_pragma': None, 'start_index': 1, 'flags': flags}, stream)
+			configs = config_paths([str(folder.joinpath('*.json'))])
+			self.assertEqual(configs, [folder.joinpath('a.json'), folder.joinpath('b.json')])
+			self.assertRaises(ValueError, lambda: config_paths([str(folder.joinpath('*.txt'))]))
+			
+			export(configs, no_cache=True)
+			self.assertEqual(folder.joinpath('a.properties').read_text(), folder.joinpath('b.properties').read_text())
+			self.assertEqual(folder.joinpath('a.glsl').read_text(), folder.joinpath('b.glsl').read_text())
+			self.assertRaises(ValueError, lambda: export(configs, watch=True))
+
+	def test_line_width(self):
+		bc = BlockCollection.from_strings
+		masks = {frozenset(['a']): bc(['oak_stairs', 'birch_stairs', 'spruce_stairs']), frozenset(['b']): bc(['oak_slab'])}
+		config = {'flags': {'a': '', 'b': ''}, 'start_index': 1, 'decoder_pragma': None, 'line_width': 40}
+		with tempfile.TemporaryDirectory() as folder:
+			path = Path(folder).joinpath('block.properties')
+			generate_properties_file(path, masks, config)
+			lines = path.read_text().split('\n')
+			self.assertEqual(lines[-7:], [
+				'# a',
+				'block.1 = minecraft:oak_stairs \\',
+				'    minecraft:birch_stairs \\',
+				'    minecraft:spruce_stairs',
+				'',
+				'# b',
+				'block.2 = minecraft:oak_slab',
+			])
+			
+			# Unchanged files are left alone
+			written = path.stat().st_mtime_ns
+			generate_properties_file(path, masks, config)
+			self.assertEqual(path.stat().st_mtime_ns, written)
+			self.assertEqual([child.name for child in Path(folder).iterdir()], ['block.properties'])
+			# Files are compared by content, even when their size and mtime did not change
+			stat = path.stat()
+			path.write_text(path.read_text().replace('oak_slab', 'oak_slax'))
+			os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+			generate_properties_file(path, masks, config)
+			self.assertEqual(path.read_text().split('\n')[-7:], lines[-7:])
+			
+			path = Path(folder).joinpath('decoder.glsl')
+			generate_decoder_file(path, masks, dict(config, line_width=24), {1: frozenset(['a']), 2: frozenset(['a']), 3: frozenset(['b'])})
+			self.assertIn('    return id == 1 ||\n        id == 2;', path.read_text())
+
+	def test_watch(self):
+		with tempfile.TemporaryDirectory() as folder:
+			config = Path(folder, 'config.json')
+			def write_config(flags, text = None):
+				config.write_text(text or json.dumps({'properties_file': 'block.properties', 'decoder_file': 'block.glsl', 'decoder_pragma': None, 'start_index': 1, 'flags': flags}))
+				# Make sure the change is visible even on coarse filesystem clocks
+				stat = config.stat()
+				os.utime(config, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9 * (polls[0] + 1)))
+			def create_tag():
+				Path(folder, 'sway').mkdir()
+				Path(folder, 'sway', '_bool.tsv').write_text('tall_grass')
+			steps = [
+				create_tag,
+				lambda: write_config({'sway': 'sway'}, '{"flags": {'),
+				lambda: write_config({'sway': 'sway + [fern]'}),
+			]
+			polls = [0]
+			outputs = []
+			def poll(_):
+				outputs.append(Path(folder, 'block.properties').read_text() if Path(folder, 'block.properties').exists() else None)
+				if polls[0] == len(steps):
+					raise KeyboardInterrupt()
+				steps[polls[0]]()
+				polls[0] += 1
+			write_config({'sway': 'sway'})
+			with mock.patch.object(export_module, 'library', TagLibrary(folder)), mock.patch.object(export_module.time, 'sleep', poll):
+				self.assertRaises(ValueError, lambda: export(config, watch=True, jobs=2))
+				export(config, watch=True)
+			# The missing tag fails the first export, which is retried once the tag exists
+			self.assertEqual([output and output.splitlines()[-1] for output in outputs], [
+				None,
+				'block.1 = minecraft:tall_grass',
+				'block.1 = minecraft:tall_grass',
+				'block.1 = minecraft:tall_grass minecraft:fern',
+			])
+
+	def test_id_encoding(self):
+		config = {'flags': {'a': '', 'b': '', 'c': ''}, 'start_index': 100}
+		masks = {frozenset(['a']): None, frozenset(['a', 'c']): None, frozenset(['b']): None}
+		self.assertEqual(assign_ids(masks, config), {100: frozenset(['a']), 101: frozenset(['a', 'c']), 102: frozenset(['b'])})
+		self.assertEqual(assign_ids(masks, dict(config, id_encoding='bits')), {101: frozenset(['a']), 105: frozenset(['a', 'c']), 102: frozenset(['b'])})
+		self.assertRaises(ValueError, lambda: assign_ids(masks, dict(config, id_encoding='huffman')))
+		
+		mapping = assign_ids(masks, config)
+		states = ['a', 'b', 'c']
+		self.assertEqual(_decode_terms('a', states, 100, 'P', 'chain', mapping), ['id == 100', 'id == 101'])
+		self.assertEqual(_decode_terms('c', states, 100, 'P', 'table', mapping), ['id >= 100 && id <= 102 && (P_FLAGS_0[id - 100] & 0x00000004u) != 0u'])
+		self.assertEqual(_decode_terms('c', states, 100, 'P', 'bits', mapping), ['id >= 100 && id <= 107 && ((id - 100) & 4) != 0'])
+
+	def test_id_order(self):
+		states = ['a', 'b', 'c', 'd']
+		masks = [frozenset(mask) for mask in [['a'], ['a', 'b'], ['a', 'c'], ['b'], ['b', 'c', 'd'], ['c'], ['c', 'd'], ['d']]]
+		bits = {mask: sum(1 << states.index(flag) for flag in mask) for mask in masks}
+		ordered = order_ranges(masks, states)
+		self.assertEqual(sorted(ordered, key=masks.index), masks)
+		self.assertLess(_ranges(ordered, bits), _ranges(masks, bits))
+		
+		mapping = {100: frozenset(['a']), 101: frozenset(['a', 'b']), 102: frozenset(['b']), 103: frozenset(['a'])}
+		self.assertEqual(_decode_terms('a', states, 100, 'P', 'chain', mapping, ranges=True), ['(id >= 100 && id <= 101)', 'id == 103'])
+		self.assertEqual(_decode_terms('b', states, 100, 'P', 'chain', mapping, ranges=True), ['id >= 101 && id <= 102'])
\ No newline at end of file
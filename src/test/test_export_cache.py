@@ -0,0 +1,27 @@
+from pathlib import Path
+import tempfile
+import unittest
+from core.block import BlockCollection
+
+from core.tag import TagLibrary
+from export_cache import CACHE_FILE, ExportCache
+
+class TestExportCache(unittest.TestCase):
+	def test_cache(self):
+		with tempfile.TemporaryDirectory() as folder:
+			Path(folder, 'stairs').mkdir()
+			file = Path(folder, 'stairs', '_bool.tsv')
+			file.write_text('oak_stairs')
+			library = TagLibrary(folder)
+			cache = ExportCache(library)
+			self.assertIsNone(cache.get('stairs'))
+			cache.put('stairs', (), BlockCollection.from_strings(['oak_stairs']), ['stairs'])
+			cache.save()
+			self.assertTrue(Path(folder, CACHE_FILE).exists())
+	
+			cached = ExportCache(library)
+			self.assertEqual(cached.get('stairs'), BlockCollection.from_strings(['oak_stairs']))
+			self.assertIsNone(cached.get('stairs', (True,)))
+	
+			file.write_text('oak_stairs\nbirch_stairs')
+			self.assertIsNone(ExportCache(library).get('stairs'))
\ No newline at end of file
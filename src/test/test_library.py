@@ -0,0 +1,53 @@
+import json
+import os
+from pathlib import Path
+import tempfile
+import unittest
+from unittest import mock
+
+import library
+from core.tag import TagLibrary
+
+class TestServe(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+		patches = [mock.patch.object(library, 'library', TagLibrary(self.folder.name)), mock.patch.object(library, 'DATA_DIR', self.folder.name)]
+		for patch in patches:
+			patch.start()
+			self.addCleanup(patch.stop)
+		self.addCleanup(self.folder.cleanup)
+
+	def request(self, **request):
+		return json.loads(library.handle_request(json.dumps(request)))
+
+	def test_query(self):
+		self.assertEqual(self.request(id=1, command='create', tag='sway'), {'id': 1, 'result': None, 'ok': True})
+		self.assertTrue(self.request(command='blocks', blocks=['tall_grass', 'fern'], add=['sway'])['ok'])
+		self.assertEqual(self.request(command='query', expression='sway - [fern]'), {'result': ['minecraft:tall_grass'], 'ok': True})
+		self.assertEqual(self.request(command='which', blocks=['fern'])['result'], {'fern': ['sway']})
+
+	def test_edit(self):
+		self.request(command='create', tag='plant', values=['small'])
+		self.assertTrue(self.request(command='edit', tag='plant', add=['tall'])['ok'])
+		self.assertTrue(self.request(command='blocks', blocks=['tall_grass'], add=['plant:tall'])['ok'])
+		self.assertEqual(self.request(command='query', expression='plant:tall')['result'], ['minecraft:tall_grass'])
+		self.assertFalse(self.request(command='edit', tag='missing', add=['tall'])['ok'])
+		self.request(command='create', tag='sway')
+		self.assertEqual(self.request(command='edit', tag='sway', add=['tall']), {'ok': False, 'error': 'Cannot edit non-enum tags!'})
+
+	def test_errors(self):
+		response = self.request(id='a', command='query', expression='sway +')
+		self.assertEqual((response['id'], response['ok']), ('a', False))
+		self.assertIn('error', response)
+		self.assertFalse(self.request(command='explode')['ok'])
+		self.assertEqual(json.loads(library.handle_request('not json'))['ok'], False)
+
+	def test_refresh(self):
+		self.request(command='create', tag='sway')
+		self.request(command='blocks', blocks=['tall_grass'], add=['sway'])
+		file = Path(self.folder.name, 'sway', '_bool.tsv')
+		file.write_text('minecraft:fern\nminecraft:vine')
+		# Make sure the change is visible even on coarse filesystem clocks
+		stat = file.stat()
+		os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+		self.assertEqual(self.request(command='query', expression='sway')['result'], ['minecraft:fern', 'minecraft:vine'])
\ No newline at end of file